@@ -0,0 +1,203 @@
+"""Local stand-in servers for OpenWeatherMap, Gemini and Twitter
+
+Each fake runs a ThreadingHTTPServer on 127.0.0.1 with configurable latency, error
+rate and rate-limit (429) rate, so the bot can be benchmarked without any network.
+"""
+import json
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+from requests.adapters import HTTPAdapter
+
+AQI_CATEGORIES = ["Good", "Fair", "Moderate", "Poor", "Very Poor"]
+
+@dataclass
+class FaultProfile:
+    latency: float = 0.02
+    # Latency is drawn uniformly from latency ± jitter
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: int = 1
+    requests: int = field(default=0, init=False)
+
+    def delay(self) -> float:
+        return max(0.0, random.uniform(self.latency - self.jitter, self.latency + self.jitter))
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without this, Nagle + delayed ACK add ~40 ms per keep-alive request
+    disable_nagle_algorithm = True
+    server: 'FakeServer'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _handle(self) -> None:
+        body = self._read_body()
+        profile = self.server.profile
+        profile.requests += 1
+        time.sleep(profile.delay())
+
+        roll = random.random()
+        if roll < profile.rate_limit_rate:
+            self._send_json(429, self.server.error_payload(429, 'rate limited'),
+                            {'Retry-After': str(profile.retry_after)})
+            return
+        if roll < profile.rate_limit_rate + profile.error_rate:
+            self._send_json(503, self.server.error_payload(503, 'injected failure'))
+            return
+        self.server.respond(self, body)
+
+    do_GET = _handle
+    do_POST = _handle
+
+class FakeServer(ThreadingHTTPServer, ABC):
+    daemon_threads = True
+    # Every Twitter account gets its own client session, so many connections arrive at once
+    request_queue_size = 512
+
+    def __init__(self, profile: Optional[FaultProfile] = None):
+        super().__init__(('127.0.0.1', 0), FakeHandler)
+        self.profile = profile or FaultProfile()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def error_payload(self, status: int, message: str) -> Dict:
+        return {'error': message}
+
+    @abstractmethod
+    def respond(self, handler: FakeHandler, body: bytes) -> None:
+        ...
+
+    def start(self) -> 'FakeServer':
+        self._thread = threading.Thread(target=self.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+class FakeOpenWeather(FakeServer):
+    """Serves /data/2.5/air_pollution, /forecast and /history with random but plausible readings"""
+
+    # The real forecast covers the current hour plus four days
+    forecast_hours = 96
+
+    @staticmethod
+    def _entry(dt: int) -> Dict:
+        pm25 = random.uniform(5, 150)
+        components = {
+            'co': random.uniform(200, 2000),
+            'no': random.uniform(0, 20),
+            'no2': random.uniform(5, 80),
+            'o3': random.uniform(10, 150),
+            'so2': random.uniform(2, 40),
+            'pm2_5': pm25,
+            'pm10': pm25 * random.uniform(1.2, 2.0),
+            'nh3': random.uniform(1, 30),
+        }
+        aqi_index = 1 + min(4, int(pm25 // 30))
+        return {'main': {'aqi': aqi_index}, 'components': components, 'dt': dt}
+
+    def respond(self, handler: FakeHandler, body: bytes) -> None:
+        path = handler.path.split('?')[0]
+        hour = int(time.time()) // 3600 * 3600
+        if path == '/data/2.5/air_pollution':
+            entries = [self._entry(hour)]
+        elif path == '/data/2.5/air_pollution/forecast':
+            entries = [self._entry(hour + i * 3600) for i in range(self.forecast_hours)]
+        elif path == '/data/2.5/air_pollution/history':
+            query = parse_qs(urlparse(handler.path).query)
+            start, end = int(query['start'][0]), int(query['end'][0])
+            first = -(-start // 3600) * 3600
+            entries = [self._entry(dt) for dt in range(first, end, 3600)]
+        else:
+            handler._send_json(404, {'cod': 404, 'message': 'not found'})
+            return
+        handler._send_json(200, {'coord': {'lon': 0, 'lat': 0}, 'list': entries})
+
+class FakeGemini(FakeServer):
+    """Answers generateContent with plain-text tips, or a per-category JSON table when JSON is requested"""
+
+    def error_payload(self, status: int, message: str) -> Dict:
+        # google-api-core expects Google's error envelope
+        return {'error': {'code': status, 'message': message,
+                          'status': 'RESOURCE_EXHAUSTED' if status == 429 else 'UNAVAILABLE'}}
+
+    def respond(self, handler: FakeHandler, body: bytes) -> None:
+        if ':generateContent' not in handler.path:
+            handler._send_json(404, {'error': {'code': 404, 'message': 'not found'}})
+            return
+        request = json.loads(body or b'{}')
+        config = request.get('generationConfig') or request.get('generation_config') or {}
+        if config.get('responseMimeType') == 'application/json' or config.get('response_mime_type') == 'application/json':
+            text = json.dumps({category: [f"{category} air: take care and stay hydrated #{i}" for i in range(10)]
+                               for category in AQI_CATEGORIES})
+        else:
+            text = "\n".join(f"Stay safe, check the air before heading out #{i}" for i in range(10))
+        handler._send_json(200, {
+            'candidates': [{
+                'content': {'parts': [{'text': text}], 'role': 'model'},
+                'finishReason': 'STOP',
+                'index': 0
+            }]
+        })
+
+class FakeTwitter(FakeServer):
+    """Accepts v2 create_tweet and v1.1 update_status calls"""
+
+    def error_payload(self, status: int, message: str) -> Dict:
+        return {'errors': [{'message': message}]}
+
+    def __init__(self, profile: Optional[FaultProfile] = None):
+        super().__init__(profile)
+        self._ids = count(1)
+
+    def respond(self, handler: FakeHandler, body: bytes) -> None:
+        tweet_id = str(next(self._ids))
+        if handler.path.startswith('/2/tweets'):
+            text = json.loads(body or b'{}').get('text', '')
+            handler._send_json(201, {'data': {'id': tweet_id, 'text': text}})
+        elif handler.path.startswith('/1.1/statuses/update.json'):
+            handler._send_json(200, {'id': int(tweet_id), 'id_str': tweet_id, 'text': ''})
+        else:
+            handler._send_json(404, {'errors': [{'message': 'not found'}]})
+
+class RedirectAdapter(HTTPAdapter):
+    """Rewrites requests for a real API host to a local fake before sending"""
+
+    def __init__(self, target_base_url: str, source_prefix: str = 'https://api.twitter.com', **kwargs):
+        super().__init__(**kwargs)
+        self.target_base_url = target_base_url
+        self.source_prefix = source_prefix
+
+    def send(self, request, **kwargs):
+        if request.url.startswith(self.source_prefix):
+            request.url = self.target_base_url + request.url[len(self.source_prefix):]
+        return super().send(request, **kwargs)
@@ -0,0 +1,78 @@
+"""Cold-start import benchmark for main.py
+
+Runs `python -X importtime -c "import main"` in fresh interpreters and fails if the
+median cumulative import time of `main` exceeds the threshold, or if any of the heavy
+SDKs that should be imported lazily show up at module load.
+
+Usage: python benchmarks/import_time.py [--runs 5] [--threshold-ms 400]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only be imported when a message is generated or a tweet is posted
+LAZY_MODULES = ['tweepy', 'google.generativeai', 'grpc']
+
+DEFAULT_THRESHOLD_MS = 400.0
+
+def measure_once() -> Tuple[float, Dict[str, int]]:
+    """Import main in a fresh interpreter; return its cumulative import time (ms) and per-module times (us)"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing main failed:\n{result.stderr}")
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative)
+    return modules['main'] / 1000.0, modules
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Fail if importing main.py regresses past a threshold")
+    parser.add_argument('--runs', type=int, default=5, help="Number of fresh interpreters to time")
+    parser.add_argument('--threshold-ms', type=float, default=DEFAULT_THRESHOLD_MS,
+                        help="Maximum allowed median import time of main in milliseconds")
+    args = parser.parse_args()
+
+    timings = []
+    modules = {}
+    for _ in range(args.runs):
+        elapsed_ms, modules = measure_once()
+        timings.append(elapsed_ms)
+
+    median_ms = statistics.median(timings)
+    print(f"import main: median {median_ms:.1f} ms over {args.runs} runs "
+          f"(min {min(timings):.1f} ms, max {max(timings):.1f} ms)")
+
+    slowest = sorted(((us, name) for name, us in modules.items() if name != 'main' and '.' not in name),
+                     reverse=True)[:5]
+    for us, name in slowest:
+        print(f"  {name}: {us / 1000.0:.1f} ms")
+
+    failed = False
+    eager = [name for name in LAZY_MODULES if name in modules]
+    if eager:
+        print(f"FAIL: heavy modules imported at module load: {', '.join(eager)}")
+        failed = True
+    if median_ms > args.threshold_ms:
+        print(f"FAIL: median import time {median_ms:.1f} ms exceeds threshold {args.threshold_ms:.1f} ms")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
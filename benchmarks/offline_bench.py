@@ -0,0 +1,191 @@
+"""Offline end-to-end benchmark for the bot
+
+Starts local fakes for OpenWeatherMap, Gemini and Twitter (see fake_servers.py), points
+main.py at them and drives AQIBot.update_aqi one location at a time, the threaded
+run_locations() flow used by __main__, run_locations_async() or the staged pipeline.
+Reports throughput and p50/p95/p99 per stage for each location count. Needs no network
+access.
+
+Usage: python benchmarks/offline_bench.py [--sizes 10 100 1000] [--mode both] [--latency 0.02]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import main  # noqa: E402
+from fake_servers import FakeGemini, FakeOpenWeather, FakeTwitter, FaultProfile, RedirectAdapter  # noqa: E402
+
+class RedirectingTwitterClients(main.TwitterClientRegistry):
+    """Client registry whose tweepy sessions are redirected to the fake Twitter server"""
+
+    def __init__(self, base_url: str):
+        super().__init__()
+        self.base_url = base_url
+
+    def _redirect(self, client):
+        adapter = RedirectAdapter(self.base_url)
+        client.session.mount('https://api.twitter.com', adapter)
+        return client
+
+    def get_client(self, credentials):
+        with self._lock:
+            known = self._key(credentials) in self._clients
+        client = super().get_client(credentials)
+        return client if known else self._redirect(client)
+
+    def get_api(self, credentials):
+        with self._lock:
+            known = self._key(credentials) in self._apis
+        api = super().get_api(credentials)
+        return api if known else self._redirect(api)
+
+def make_locations(n: int) -> List[main.Location]:
+    """n locations on distinct grid cells, each with its own Twitter account"""
+    rng = random.Random(n)
+    locations = []
+    for i in range(n):
+        credentials = {
+            'api_key': f'bench-key-{i}',
+            'api_secret': f'bench-secret-{i}',
+            'access_token': f'bench-token-{i}',
+            'access_token_secret': f'bench-token-secret-{i}'
+        }
+        locations.append(main.Location(
+            name=f"Bench-{i:04d}",
+            latitude=round(rng.uniform(-60, 60), 3),
+            longitude=round(rng.uniform(-180, 180), 3),
+            timezone='UTC',
+            twitter_credentials=credentials,
+            openweather_api_key='bench-openweather',
+            gemini_api_key='bench-gemini'
+        ))
+    return locations
+
+def configure_bot(args: argparse.Namespace, servers: Dict[str, object]) -> None:
+    """Point main.py at the fakes and strip state that would skew repeated runs"""
+    main.OPENWEATHER_AIR_POLLUTION_URL = servers['openweather'].base_url + '/data/2.5/air_pollution'
+    os.environ['GEMINI_API_ENDPOINT'] = servers['gemini'].base_url
+    main._twitter_clients = RedirectingTwitterClients(servers['twitter'].base_url)
+
+    main.configure_logging(args.log_level, 'json')
+    main.configure_http(main.HTTPConfig(pool_size=max(10, args.concurrency)))
+    main.configure_retry(main.RetryPolicy(attempts=args.attempts, base_delay=0.05, deadline=30.0))
+    main.configure_cache(None)
+    main.configure_post_state(None)
+    main.configure_reading_store(None)
+    main.configure_tip_pool(main.TipPool(path=None, size=main.DEFAULT_TIP_POOL_SIZE) if args.tip_pool else None)
+    # Dry runs still pay OpenWeatherMap and Gemini latency but keep tweets in memory
+    main.configure_sink(main.MemorySink() if args.dry_run else main.TwitterSink())
+    if not args.respect_rate_limits:
+        unlimited = main.RateLimit(rate=1e9, per=1.0, burst=10 ** 9)
+        main.rate_limiters = main.RateLimiterRegistry({name: unlimited for name in main.DEFAULT_RATE_LIMITS})
+
+def run_scenario(mode: str, locations: List[main.Location], concurrency: int,
+                 async_concurrency: int = main.DEFAULT_ASYNC_CONCURRENCY) -> Dict:
+    report = main.RunReport()
+    pipeline = None
+    main.configure_run_report(report)
+    started = time.perf_counter()
+    if mode == 'update_aqi':
+        results = {location.name: main.AQIBot(location).update_aqi() for location in locations}
+    elif mode == 'pipeline':
+        results, pipeline = main.run_locations_pipelined(locations)
+    elif mode == 'asyncio':
+        results = asyncio.run(main.run_locations_async(locations, concurrency=async_concurrency))
+    else:
+        results = main.run_locations(locations, concurrency=concurrency)
+    wall = time.perf_counter() - started
+    main.configure_run_report(None)
+
+    summary = report.summarize()
+    result = {
+        'mode': mode,
+        'locations': len(locations),
+        'succeeded': sum(1 for ok in results.values() if ok),
+        'wall_s': round(wall, 3),
+        'throughput_per_s': round(len(locations) / wall, 2) if wall > 0 else None,
+        'stages': {
+            stage: {key: info[key] for key in ('count', 'failures', 'retries', 'p50_ms', 'p95_ms', 'p99_ms')}
+            for stage, info in summary['stages'].items()
+        }
+    }
+    if pipeline is not None:
+        result['pipeline'] = pipeline.summary()
+    return result
+
+def format_result(result: Dict) -> str:
+    lines = [
+        f"{result['mode']} x {result['locations']}: {result['succeeded']}/{result['locations']} ok, "
+        f"{result['wall_s']:.2f} s wall, {result['throughput_per_s']} locations/s",
+        f"  {'stage':<14}{'count':>7}{'fail':>6}{'retry':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    ]
+    for stage, info in result['stages'].items():
+        lines.append(f"  {stage:<14}{info['count']:>7}{info['failures']:>6}{info['retries']:>7}"
+                     f"{info['p50_ms']:>10.1f}{info['p95_ms']:>10.1f}{info['p99_ms']:>10.1f}")
+    for stage, info in result.get('pipeline', {}).items():
+        lines.append(f"  queue {stage:<12} {info['items']} items, {info['throughput_per_s']}/s, "
+                     f"util {info['utilization']}, max depth {info['max_queue_depth']}")
+    return "\n".join(lines)
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the bot end to end against local fake APIs")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help="Location counts to run")
+    parser.add_argument('--mode', choices=['update_aqi', 'run_locations', 'asyncio', 'pipeline', 'both'],
+                        default='both',
+                        help="Drive AQIBot.update_aqi sequentially, the threaded __main__ flow, "
+                             "run_locations_async, the staged pipeline, or the first two")
+    parser.add_argument('--concurrency', type=int, default=main.DEFAULT_CONCURRENCY,
+                        help="Worker count for run_locations")
+    parser.add_argument('--async-concurrency', type=int, default=main.DEFAULT_ASYNC_CONCURRENCY,
+                        help="Locations in flight for the asyncio mode")
+    parser.add_argument('--latency', type=float, default=0.02, help="Base latency of every fake, in seconds")
+    parser.add_argument('--jitter', type=float, default=0.005, help="± latency jitter, in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument('--attempts', type=int, default=main.RetryPolicy.attempts, help="OpenWeatherMap attempts")
+    parser.add_argument('--tip-pool', action='store_true', help="Serve tips from the daily pool instead of per tweet")
+    parser.add_argument('--dry-run', action='store_true', help="Collect tweets in a MemorySink instead of the fake Twitter")
+    parser.add_argument('--respect-rate-limits', action='store_true',
+                        help="Keep the bot's client-side rate limits instead of lifting them")
+    parser.add_argument('--log-level', default='ERROR', help="Bot log level during the run")
+    parser.add_argument('--json', default=None, help="Also write results as JSON to this path")
+    args = parser.parse_args()
+
+    def profile() -> FaultProfile:
+        return FaultProfile(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                            rate_limit_rate=args.rate_limit_rate, retry_after=0)
+
+    servers = {
+        'openweather': FakeOpenWeather(profile()).start(),
+        'gemini': FakeGemini(profile()).start(),
+        'twitter': FakeTwitter(profile()).start(),
+    }
+    try:
+        configure_bot(args, servers)
+        modes = ['update_aqi', 'run_locations'] if args.mode == 'both' else [args.mode]
+        results = []
+        for size in args.sizes:
+            locations = make_locations(size)
+            for mode in modes:
+                result = run_scenario(mode, locations, args.concurrency, args.async_concurrency)
+                results.append(result)
+                print(format_result(result))
+                print()
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, indent=2)
+    finally:
+        for server in servers.values():
+            server.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -1,13 +1,1566 @@
-import tweepy
 import requests
 import os
+import asyncio
 import json
-from datetime import datetime
+import sqlite3
+import argparse
+import logging
+import threading
+import time
+import random
+import signal
+import queue
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import asynccontextmanager, contextmanager
+from datetime import date, datetime
+from email.utils import parsedate_to_datetime
 import pytz
+import numpy as np
 from dotenv import load_dotenv
-import google.generativeai as genai
 from dataclasses import dataclass
-from typing import Dict, Optional
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, Iterator, List, Mapping, Optional, Tuple
+from requests.adapters import HTTPAdapter
+from cachetools import LRUCache
+import schedule
+
+# tweepy and google.generativeai are slow to import (grpc/protobuf), so they are only
+# loaded on the paths that generate a message or post; see load_genai() and
+# TwitterClientRegistry.
+if TYPE_CHECKING:
+    import tweepy
+
+# Default number of locations processed in parallel by run_locations()
+DEFAULT_CONCURRENCY = 4
+# Coroutines are cheap, so run_locations_async() keeps many more requests in flight
+DEFAULT_ASYNC_CONCURRENCY = 100
+
+OPENWEATHER_AIR_POLLUTION_URL = "http://api.openweathermap.org/data/2.5/air_pollution"
+
+# Pollutant concentrations (μg/m³) reported in an air_pollution "components" block
+OPENWEATHER_COMPONENTS = ['co', 'no', 'no2', 'o3', 'so2', 'pm2_5', 'pm10', 'nh3']
+
+# Decimal places coordinates are rounded to before batching (~1 km cells)
+GRID_PRECISION = 2
+
+# OpenWeatherMap refreshes air pollution data roughly hourly
+DEFAULT_CACHE_TTL = 1800
+DEFAULT_CACHE_SIZE = 1024
+
+# The hourly forecast covers ~4 days, so one fetch can serve intraday posts for hours
+DEFAULT_FORECAST_TTL = 6 * 3600
+
+# History is requested in windows of this many days (24 hourly rows per day)
+DEFAULT_BACKFILL_WINDOW_DAYS = 7
+
+DEFAULT_READINGS_DB = "aqi_readings.db"
+
+DEFAULT_POST_STATE_FILE = "last_posted.json"
+# An unchanged category is only reposted once the EPA AQI moves by this much...
+DEFAULT_MIN_AQI_DELTA = 10
+# ...or once the last post is this old
+DEFAULT_REPOST_AFTER_HOURS = 12.0
+
+DEFAULT_OUTBOX_DB = "outbox.db"
+DEFAULT_OUTBOX_WORKERS = 2
+DEFAULT_OUTBOX_MAX_ATTEMPTS = 5
+# Queued tweets quote the local time and current AQI, so older ones are dropped instead of posted
+DEFAULT_OUTBOX_MAX_AGE = 3600.0
+
+DEFAULT_TIP_POOL_FILE = "tip_pool.json"
+DEFAULT_TIP_POOL_SIZE = 5
+# After a failed fill, the pool doesn't ask Gemini for that category again for this long
+DEFAULT_TIP_POOL_RETRY_AFTER = 600.0
+
+# Used by the daemon for locations without a "schedule" entry (matches the daily Actions cron)
+DEFAULT_SCHEDULE = {'at': ['08:00']}
+
+# OpenWeatherMap AQI categories, indexed by aqi_index - 1
+AQI_CATEGORIES = ["Good", "Fair", "Moderate", "Poor", "Very Poor"]
+AQI_CATEGORY_EMOJIS = ["🟢", "🟢", "🟡", "🟠", "🔴"]
+# EPA AQI range posted alongside each OpenWeatherMap category
+AQI_CATEGORY_EPA_RANGES = [(0, 50), (51, 100), (101, 150), (151, 200), (201, 300)]
+
+# Stages of run_locations_pipelined() and the default worker count for each
+PIPELINE_STAGES = ['fetch', 'categorize', 'compose', 'post']
+DEFAULT_PIPELINE_WORKERS = {'fetch': 4, 'categorize': 1, 'compose': 2, 'post': 4}
+# Items buffered between two stages before the upstream stage blocks
+DEFAULT_PIPELINE_QUEUE_SIZE = 64
+# Most readings categorized in one vectorized call
+DEFAULT_CATEGORIZE_BATCH = 64
+
+# Character budget for a health tip so the tweet stays within limits
+TIP_MAX_LENGTH = 70
+
+GEMINI_MODEL = 'gemini-2.0-flash'
+# Posted when Gemini can't provide a health tip
+FALLBACK_CARING_MESSAGE = "Stay safe and take appropriate precautions for today's air quality."
+
+@dataclass
+class HTTPConfig:
+    pool_size: int = 10
+    keep_alive: bool = True
+    connect_timeout: float = 5.0
+    read_timeout: float = 15.0
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        return (self.connect_timeout, self.read_timeout)
+
+logger = logging.getLogger("aqibot")
+
+# Attributes every LogRecord has; anything else was passed via extra= and becomes a JSON field
+_LOG_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+class JSONLogFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, including location/stage/duration_ms extras"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, pytz.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'message': record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _LOG_RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class LocationLogger(logging.LoggerAdapter):
+    """Adds the location name to every record while keeping per-call extra fields"""
+
+    def process(self, msg, kwargs):
+        kwargs['extra'] = {**self.extra, **kwargs.get('extra', {})}
+        return msg, kwargs
+
+def configure_logging(level: str = 'INFO', fmt: str = 'json') -> None:
+    """Send aqibot logs to stderr as JSON lines (or plain text) at the given level"""
+    handler = logging.StreamHandler()
+    if fmt == 'json':
+        handler.setFormatter(JSONLogFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    logger.handlers = [handler]
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+def elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile (0-100) of an already sorted, non-empty list"""
+    rank = max(1, int(-(-q * len(sorted_values) // 100)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+# Pipeline stages recorded in the run report, in execution order
+REPORT_STAGES = ['config', 'fetch', 'categorize', 'gemini', 'post', 'post_fallback']
+
+class RunReport:
+    """Per-location, per-stage timings, retry counts and payload sizes for a single run"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.records: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    @contextmanager
+    def stage(self, location: Optional[str], stage: str) -> Iterator[Dict]:
+        """Time a stage; the yielded record can be updated with ok/retries/bytes"""
+        record = {'location': location, 'stage': stage, 'ok': True, 'retries': 0, 'bytes': 0}
+        started = time.perf_counter()
+        try:
+            yield record
+        except Exception:
+            record['ok'] = False
+            raise
+        finally:
+            record['duration_ms'] = elapsed_ms(started)
+            self.add(record)
+
+    def summarize(self) -> Dict:
+        """Aggregate the raw records per stage and per location"""
+        with self._lock:
+            records = list(self.records)
+
+        stages = {}
+        for stage in REPORT_STAGES:
+            durations = sorted(r['duration_ms'] for r in records if r['stage'] == stage)
+            if not durations:
+                continue
+            stage_records = [r for r in records if r['stage'] == stage]
+            stages[stage] = {
+                'count': len(durations),
+                'failures': sum(1 for r in stage_records if not r['ok']),
+                'retries': sum(r['retries'] for r in stage_records),
+                'bytes': sum(r['bytes'] for r in stage_records),
+                'total_ms': round(sum(durations), 1),
+                'p50_ms': percentile(durations, 50),
+                'p95_ms': percentile(durations, 95),
+                'p99_ms': percentile(durations, 99),
+                'max_ms': durations[-1]
+            }
+
+        locations: Dict[str, Dict] = {}
+        for r in records:
+            if r['location'] is None:
+                continue
+            entry = locations.setdefault(r['location'], {})
+            stage = entry.setdefault(r['stage'], {'duration_ms': 0.0, 'ok': True, 'retries': 0, 'bytes': 0})
+            stage['duration_ms'] = round(stage['duration_ms'] + r['duration_ms'], 1)
+            stage['ok'] = stage['ok'] and r['ok']
+            stage['retries'] += r['retries']
+            stage['bytes'] += r['bytes']
+
+        return {
+            'started_at': datetime.fromtimestamp(self.started_at, pytz.utc).isoformat(),
+            'wall_ms': round((time.time() - self.started_at) * 1000, 1),
+            'stages': stages,
+            'locations': locations,
+            'records': records
+        }
+
+    def write_json(self, path: str) -> None:
+        with open(path, 'w') as f:
+            json.dump(self.summarize(), f, indent=2, ensure_ascii=False)
+
+    def format_table(self) -> str:
+        """Human-readable per-location stage timings in milliseconds"""
+        summary = self.summarize()
+        stages = [stage for stage in REPORT_STAGES if stage in summary['stages'] and stage != 'config']
+        name_width = max([len('Location')] + [len(name) for name in summary['locations']])
+        header = f"{'Location':<{name_width}}  " + "  ".join(f"{stage:>13}" for stage in stages)
+        lines = [header, '-' * len(header)]
+        for name, entry in summary['locations'].items():
+            cells = []
+            for stage in stages:
+                info = entry.get(stage)
+                if info is None:
+                    cells.append(f"{'-':>13}")
+                else:
+                    flag = '' if info['ok'] else ' !'
+                    cells.append(f"{info['duration_ms']:>11.1f}{flag:<2}")
+            lines.append(f"{name:<{name_width}}  " + "  ".join(cells))
+        config = summary['stages'].get('config')
+        if config:
+            lines.append(f"Config load: {config['total_ms']:.1f} ms")
+        lines.append(f"Total wall time: {summary['wall_ms']:.1f} ms ('!' marks a failed stage)")
+        return "\n".join(lines)
+
+_run_report: Optional[RunReport] = None
+
+def configure_run_report(report: Optional[RunReport]) -> None:
+    """Replace the shared run report; pass None to stop recording stage timings"""
+    global _run_report
+    _run_report = report
+
+@contextmanager
+def timed_stage(location: Optional[str], stage: str) -> Iterator[Dict]:
+    """Record a stage in the current run report, or just yield a scratch record if there isn't one"""
+    report = _run_report
+    if report is None:
+        yield {}
+        return
+    with report.stage(location, stage) as record:
+        yield record
+
+# Upper bounds (seconds) of the latency histogram buckets for external dependencies
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Metrics:
+    """In-process counters, gauges and histograms rendered in Prometheus text format"""
+
+    # name -> (type, help)
+    DEFINITIONS = {
+        'aqibot_fetches_total': ('counter', "OpenWeatherMap fetches by result"),
+        'aqibot_posts_total': ('counter', "Tweets posted by location and API version (or local sink name)"),
+        'aqibot_post_fallbacks_total': ('counter', "Times the v1 API fallback was attempted"),
+        'aqibot_failures_total': ('counter', "Failures by pipeline stage"),
+        'aqibot_dependency_latency_seconds': ('histogram', "Latency of calls to external dependencies"),
+        'aqibot_pm25': ('gauge', "Latest PM2.5 concentration in μg/m³"),
+        'aqibot_pm10': ('gauge', "Latest PM10 concentration in μg/m³"),
+        'aqibot_aqi': ('gauge', "Latest EPA AQI"),
+        'aqibot_openweather_aqi_index': ('gauge', "Latest OpenWeatherMap AQI index (1-5)"),
+        'aqibot_pipeline_items_total': ('counter', "Items processed by each pipelined stage"),
+        'aqibot_pipeline_queue_depth': ('gauge', "Items waiting in front of each pipelined stage"),
+    }
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._values: Dict[str, Dict[Tuple[Tuple[str, str], ...], float]] = {}
+        self._histograms: Dict[str, Dict[Tuple[Tuple[str, str], ...], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _labels(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+        return tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        key = self._labels(labels)
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values.setdefault(name, {})[self._labels(labels)] = float(value)
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = self._labels(labels)
+        with self._lock:
+            # Per-bucket counts followed by the running sum and count
+            state = self._histograms.setdefault(name, {}).setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @staticmethod
+    def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+        if not labels:
+            return ''
+        pairs = []
+        for key, value in labels:
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            pairs.append(f'{key}="{value}"')
+        return '{' + ','.join(pairs) + '}'
+
+    def render(self) -> str:
+        """Current values in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in self.DEFINITIONS.items():
+                if name not in self._values and name not in self._histograms:
+                    continue
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(self._values.get(name, {}).items()):
+                    lines.append(f"{name}{self._format_labels(labels)} {value:g}")
+                for labels, state in sorted(self._histograms.get(name, {}).items()):
+                    for upper, count in zip(self.buckets, state):
+                        bucket_labels = labels + (('le', f"{upper:g}"),)
+                        lines.append(f"{name}_bucket{self._format_labels(bucket_labels)} {count:g}")
+                    lines.append(f"{name}_bucket{self._format_labels(labels + (('le', '+Inf'),))} {state[-1]:g}")
+                    lines.append(f"{name}_sum{self._format_labels(labels)} {state[-2]:g}")
+                    lines.append(f"{name}_count{self._format_labels(labels)} {state[-1]:g}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str) -> None:
+        """Atomically write the metrics for node_exporter's textfile collector"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+metrics = Metrics()
+
+def write_metrics_textfile(path: str) -> None:
+    try:
+        metrics.write_textfile(path)
+    except OSError as e:
+        logger.warning("Failed to write metrics file %s: %s", path, e, extra={'stage': 'metrics'})
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves metrics.render() on /metrics"""
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics request: " + format, *args, extra={'stage': 'metrics'})
+
+def start_metrics_server(port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """Serve /metrics from a background thread"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info("Serving metrics on http://%s:%d/metrics", host, port, extra={'stage': 'metrics'})
+    return server
+
+# Shared transport reused by every AQIBot instance
+_http_config = HTTPConfig()
+_http_session: Optional[requests.Session] = None
+_http_session_lock = threading.Lock()
+
+def configure_http(config: HTTPConfig) -> None:
+    """Replace the shared HTTP settings, discarding any existing session"""
+    global _http_config, _http_session
+    with _http_session_lock:
+        if _http_session is not None:
+            _http_session.close()
+            _http_session = None
+        _http_config = config
+
+def get_http_session() -> requests.Session:
+    """Return the pooled session shared by all bots, creating it on first use"""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=_http_config.pool_size,
+                pool_maxsize=_http_config.pool_size
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['Connection'] = 'keep-alive' if _http_config.keep_alive else 'close'
+            _http_session = session
+        return _http_session
+
+@dataclass
+class RateLimit:
+    rate: float
+    per: float = 60.0
+    burst: int = 1
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'RateLimit':
+        return cls(rate=float(data['rate']), per=float(data.get('per', 60.0)), burst=int(data.get('burst', 1)))
+
+# Client-side limits applied per credential (API key / Twitter access token). Override them with a
+# top-level "rate_limits" block in config.json; a location's own block may only set "twitter", since
+# the OpenWeatherMap and Gemini keys are shared by every location.
+DEFAULT_RATE_LIMITS = {
+    'openweathermap': RateLimit(rate=60, per=60, burst=10),
+    'gemini': RateLimit(rate=15, per=60, burst=5),
+    'twitter': RateLimit(rate=17, per=24 * 3600, burst=5),
+}
+
+# Longest a caller blocks waiting for a token before giving up on that call
+DEFAULT_RATE_LIMIT_WAIT = 60.0
+
+class RateLimitTimeout(Exception):
+    """Raised when a token could not be acquired within the allowed wait"""
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at ``rate / per`` tokens per second"""
+
+    def __init__(self, limit: RateLimit):
+        self.limit = limit
+        self._tokens = float(limit.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _wait_time(self) -> float:
+        """Refill, then take a token and return 0, or return how long until one is available"""
+        now = time.monotonic()
+        self._tokens = min(self.limit.burst, self._tokens + (now - self._updated) * self.limit.rate / self.limit.per)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) * self.limit.per / self.limit.rate
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Block until a token is available; False if that would take longer than ``timeout``"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                wait = self._wait_time()
+            if wait == 0.0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> bool:
+        """Like acquire(), but waits with asyncio.sleep so the event loop keeps running"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                wait = self._wait_time()
+            if wait == 0.0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+class RateLimiterRegistry:
+    """Token buckets per (provider, credential), shared by every bot in the process"""
+
+    def __init__(self, limits: Optional[Dict[str, RateLimit]] = None):
+        self._limits = dict(limits or DEFAULT_RATE_LIMITS)
+        self._overrides: Dict[Tuple[str, str], RateLimit] = {}
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, provider: str, limit: RateLimit, credential: Optional[str] = None) -> None:
+        """Set the limit for a provider, or for one credential of that provider"""
+        with self._lock:
+            if credential is None:
+                self._limits[provider] = limit
+                # Rebuild buckets lazily with the new limit, keeping per-credential overrides
+                self._buckets = {key: bucket for key, bucket in self._buckets.items()
+                                 if key[0] != provider or key in self._overrides}
+            else:
+                self._overrides[(provider, credential)] = limit
+                self._buckets.pop((provider, credential), None)
+
+    def bucket(self, provider: str, credential: str) -> Optional[TokenBucket]:
+        key = (provider, credential or '')
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                limit = self._overrides.get(key) or self._limits.get(provider)
+                if limit is None:
+                    return None
+                bucket = self._buckets[key] = TokenBucket(limit)
+            return bucket
+
+    def acquire(self, provider: str, credential: str, timeout: Optional[float] = DEFAULT_RATE_LIMIT_WAIT) -> None:
+        """Take a token for this provider/credential, raising RateLimitTimeout if none arrives in time"""
+        bucket = self.bucket(provider, credential)
+        if bucket is None:
+            return
+        started = time.perf_counter()
+        if not bucket.acquire(timeout):
+            raise RateLimitTimeout(f"{provider} rate limit: no token within {timeout:.1f}s")
+        waited = time.perf_counter() - started
+        if waited > 0.05:
+            logger.debug("Waited %.2fs for %s rate limit", waited, provider, extra={'stage': 'rate_limit'})
+
+    async def acquire_async(self, provider: str, credential: str,
+                            timeout: Optional[float] = DEFAULT_RATE_LIMIT_WAIT) -> None:
+        """Coroutine version of acquire() sharing the same buckets"""
+        bucket = self.bucket(provider, credential)
+        if bucket is None:
+            return
+        if not await bucket.acquire_async(timeout):
+            raise RateLimitTimeout(f"{provider} rate limit: no token within {timeout:.1f}s")
+
+rate_limiters = RateLimiterRegistry()
+
+def configure_rate_limits(limits: Dict[str, Dict], credentials: Optional[Dict[str, str]] = None) -> None:
+    """Apply a "rate_limits" config block, optionally scoped to specific credentials per provider"""
+    for provider, data in limits.items():
+        credential = credentials.get(provider) if credentials else None
+        if credentials is not None and credential is None:
+            continue
+        rate_limiters.configure(provider, RateLimit.from_dict(data), credential)
+
+@dataclass
+class RetryPolicy:
+    attempts: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+    # Total time budget for one location's fetch, including retries and backoff
+    deadline: float = 60.0
+    retry_statuses: Tuple[int, ...] = (429, 500, 502, 503, 504)
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter for the given (1-based) attempt"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+_retry_policy = RetryPolicy()
+
+def configure_retry(policy: RetryPolicy) -> None:
+    global _retry_policy
+    _retry_policy = policy
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date)"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(pytz.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(policy: RetryPolicy, attempt: int, deadline: float, status: Optional[int],
+                retry_after: Optional[str], error: Optional[Exception], stats: Dict,
+                log_fields: Dict) -> Optional[float]:
+    """Seconds to wait before retrying a failed attempt, or None to give up
+
+    Shared by get_with_retry() and get_with_retry_async(); logs and counts the retry.
+    """
+    if attempt >= policy.attempts:
+        return None
+
+    delay = policy.backoff(attempt)
+    retry_after = parse_retry_after(retry_after)
+    if retry_after is not None:
+        delay = retry_after
+    if time.monotonic() + delay >= deadline:
+        logger.warning("Not retrying: next attempt would pass the %.0fs deadline", policy.deadline,
+                       extra=log_fields)
+        return None
+
+    reason = f"status {status}" if status is not None else repr(error)
+    logger.warning("Attempt %d failed (%s), retrying in %.1fs", attempt, reason, delay,
+                   extra={**log_fields, 'retries': attempt})
+    stats['retries'] = stats.get('retries', 0) + 1
+    return delay
+
+def get_with_retry(url: str, params: Dict, stats: Dict, log_fields: Dict,
+                   dependency: str = 'openweathermap', policy: Optional[RetryPolicy] = None) -> requests.Response:
+    """GET through the shared session, retrying connection errors, timeouts, 429s and 5xx
+
+    Returns the last response (which may still be an error status) and raises the last
+    exception if no response was ever received. ``stats['retries']`` counts the retries made.
+    """
+    policy = policy or _retry_policy
+    deadline = time.monotonic() + policy.deadline
+    attempt = 0
+    while True:
+        attempt += 1
+        remaining = max(deadline - time.monotonic(), 0.1)
+        timeout = (min(_http_config.connect_timeout, remaining), min(_http_config.read_timeout, remaining))
+        # Waiting on the shared OpenWeatherMap budget counts against this fetch's deadline
+        rate_limiters.acquire(dependency, params.get('appid', ''), timeout=remaining)
+        started = time.perf_counter()
+        response, error = None, None
+        try:
+            response = get_http_session().get(url, params=params, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        metrics.observe('aqibot_dependency_latency_seconds', time.perf_counter() - started, dependency=dependency)
+
+        if response is not None and response.status_code not in policy.retry_statuses:
+            return response
+        if response is not None:
+            delay = retry_delay(policy, attempt, deadline, response.status_code,
+                                response.headers.get('Retry-After'), None, stats, log_fields)
+        else:
+            delay = retry_delay(policy, attempt, deadline, None, None, error, stats, log_fields)
+        if delay is None:
+            break
+        time.sleep(delay)
+
+    if response is not None:
+        return response
+    raise error
+
+async def get_with_retry_async(session, url: str, params: Dict, stats: Dict, log_fields: Dict,
+                               dependency: str = 'openweathermap',
+                               policy: Optional[RetryPolicy] = None) -> Tuple[int, bytes]:
+    """get_with_retry() over an aiohttp session, returning the last (status, body)"""
+    import aiohttp
+    policy = policy or _retry_policy
+    deadline = time.monotonic() + policy.deadline
+    attempt = 0
+    while True:
+        attempt += 1
+        remaining = max(deadline - time.monotonic(), 0.1)
+        timeout = aiohttp.ClientTimeout(connect=min(_http_config.connect_timeout, remaining),
+                                        sock_read=min(_http_config.read_timeout, remaining))
+        await rate_limiters.acquire_async(dependency, params.get('appid', ''), timeout=remaining)
+        started = time.perf_counter()
+        status, retry_after, body, error = None, None, b'', None
+        try:
+            async with session.get(url, params=params, timeout=timeout) as response:
+                status, body = response.status, await response.read()
+                retry_after = response.headers.get('Retry-After')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = e
+        metrics.observe('aqibot_dependency_latency_seconds', time.perf_counter() - started, dependency=dependency)
+
+        if status is not None and status not in policy.retry_statuses:
+            return status, body
+        delay = retry_delay(policy, attempt, deadline, status, retry_after, error, stats, log_fields)
+        if delay is None:
+            break
+        await asyncio.sleep(delay)
+
+    if status is not None:
+        return status, body
+    raise error
+
+# US EPA AQI breakpoint tables keyed by OpenWeatherMap component name.
+# Each entry is (unit conversion from μg/m³, truncation decimals, rows of (C_lo, C_hi, I_lo, I_hi)).
+# Gas conversions assume 25 °C and 1 atm: ppb = μg/m³ * 24.45 / molecular weight.
+EPA_AQI_BREAKPOINTS = {
+    'pm2_5': (1.0, 1, [
+        (0.0, 9.0, 0, 50),
+        (9.1, 35.4, 51, 100),
+        (35.5, 55.4, 101, 150),
+        (55.5, 125.4, 151, 200),
+        (125.5, 225.4, 201, 300),
+        (225.5, 325.4, 301, 500),
+    ]),
+    'pm10': (1.0, 0, [
+        (0, 54, 0, 50),
+        (55, 154, 51, 100),
+        (155, 254, 101, 150),
+        (255, 354, 151, 200),
+        (355, 424, 201, 300),
+        (425, 604, 301, 500),
+    ]),
+    # 8-hour ozone, ppm
+    'o3': (24.45 / 48.00 / 1000, 3, [
+        (0.000, 0.054, 0, 50),
+        (0.055, 0.070, 51, 100),
+        (0.071, 0.085, 101, 150),
+        (0.086, 0.105, 151, 200),
+        (0.106, 0.200, 201, 300),
+    ]),
+    # 1-hour nitrogen dioxide, ppb
+    'no2': (24.45 / 46.01, 0, [
+        (0, 53, 0, 50),
+        (54, 100, 51, 100),
+        (101, 360, 101, 150),
+        (361, 649, 151, 200),
+        (650, 1249, 201, 300),
+        (1250, 2049, 301, 500),
+    ]),
+    # 1-hour sulfur dioxide, ppb
+    'so2': (24.45 / 64.07, 0, [
+        (0, 35, 0, 50),
+        (36, 75, 51, 100),
+        (76, 185, 101, 150),
+        (186, 304, 151, 200),
+        (305, 604, 201, 300),
+        (605, 1004, 301, 500),
+    ]),
+    # 8-hour carbon monoxide, ppm
+    'co': (24.45 / 28.01 / 1000, 1, [
+        (0.0, 4.4, 0, 50),
+        (4.5, 9.4, 51, 100),
+        (9.5, 12.4, 101, 150),
+        (12.5, 15.4, 151, 200),
+        (15.5, 30.4, 201, 300),
+        (30.5, 50.4, 301, 500),
+    ]),
+}
+
+# Upper AQI bound, category name and emoji for each EPA band
+EPA_AQI_CATEGORIES = [
+    (50, "Good", "🟢"),
+    (100, "Moderate", "🟡"),
+    (150, "Unhealthy for Sensitive Groups", "🟠"),
+    (200, "Unhealthy", "🔴"),
+    (300, "Very Unhealthy", "🟣"),
+    (500, "Hazardous", "🟤"),
+]
+
+def compute_pollutant_aqi(pollutant: str, concentrations) -> np.ndarray:
+    """Vectorized EPA sub-index for one pollutant from OpenWeatherMap μg/m³ concentrations
+
+    Concentrations above the top of the table are clamped to its highest index; NaN stays NaN.
+    """
+    conversion, decimals, rows = EPA_AQI_BREAKPOINTS[pollutant]
+    table = np.asarray(rows, dtype=float)
+    c_lo, c_hi, i_lo, i_hi = table.T
+
+    scale = 10.0 ** decimals
+    values = np.asarray(concentrations, dtype=float) * conversion
+    # EPA truncates (not rounds) to the table's precision; the epsilon absorbs float noise
+    values = np.floor(np.clip(values, 0.0, c_hi[-1]) * scale + 1e-9) / scale
+
+    band = np.minimum(np.searchsorted(c_hi, values, side='left'), len(rows) - 1)
+    aqi = (i_hi[band] - i_lo[band]) / (c_hi[band] - c_lo[band]) * (values - c_lo[band]) + i_lo[band]
+    return np.round(aqi)
+
+def compute_epa_aqi(components: Mapping[str, object]) -> np.ndarray:
+    """Overall EPA AQI (max sub-index) for arrays of readings keyed by component name
+
+    Components without a breakpoint table (e.g. 'no', 'nh3') are ignored. Missing (NaN)
+    components are skipped, so the result is only NaN where every input is missing.
+    """
+    sub_indices = [compute_pollutant_aqi(name, values)
+                   for name, values in components.items() if name in EPA_AQI_BREAKPOINTS]
+    if not sub_indices:
+        raise ValueError("No EPA AQI pollutants found in components")
+    return np.fmax.reduce(np.broadcast_arrays(*sub_indices))
+
+def clamp_epa_to_category(epa_aqi, category_index) -> np.ndarray:
+    """Keep EPA AQI values inside the range of the OpenWeatherMap category they're posted with
+
+    The two scales use different breakpoints, so an unclamped value can contradict the
+    category (e.g. "Good" with an AQI of 90). NaN stays NaN.
+    """
+    ranges = np.array(AQI_CATEGORY_EPA_RANGES, dtype=float)[np.asarray(category_index)]
+    return np.clip(np.asarray(epa_aqi, dtype=float), ranges[..., 0], ranges[..., 1])
+
+def aqi_value(aqi) -> Optional[int]:
+    """A scalar AQI as an int, or None if it couldn't be computed (NaN)"""
+    aqi = float(aqi)
+    return None if np.isnan(aqi) else int(aqi)
+
+def epa_category_index(aqi) -> np.ndarray:
+    """Map EPA AQI values to indexes into EPA_AQI_CATEGORIES"""
+    upper_bounds = np.array([upper for upper, _, _ in EPA_AQI_CATEGORIES], dtype=float)
+    return np.minimum(np.searchsorted(upper_bounds, np.asarray(aqi, dtype=float), side='left'),
+                      len(EPA_AQI_CATEGORIES) - 1)
+
+def get_epa_aqi_category(components: Mapping[str, float]) -> Optional[Dict]:
+    """Scalar wrapper returning the same shape as AQIBot.get_aqi_category, on the EPA scale
+
+    Returns None when none of the components has a usable concentration.
+    """
+    epa_aqi = aqi_value(compute_epa_aqi(components))
+    if epa_aqi is None:
+        return None
+    _, category, emoji = EPA_AQI_CATEGORIES[int(epa_category_index(epa_aqi))]
+    return {
+        'category': category,
+        'emoji': emoji,
+        'epa_aqi': epa_aqi
+    }
+
+class Reading:
+    """One OpenWeatherMap reading: AQI index (1-5), hour timestamp and all eight components in μg/m³
+
+    Fixed slots keep it several times smaller than the parsed JSON dict, which adds up across
+    long histories and large location grids. Missing components are NaN. Instances are
+    shared between caches and callers, so treat them as immutable.
+    """
+    __slots__ = ('aqi_index', 'dt', 'co', 'no', 'no2', 'o3', 'so2', 'pm2_5', 'pm10', 'nh3', 'forecast')
+
+    def __init__(self, aqi_index: int, dt: Optional[int] = None, co: float = np.nan, no: float = np.nan,
+                 no2: float = np.nan, o3: float = np.nan, so2: float = np.nan, pm2_5: float = np.nan,
+                 pm10: float = np.nan, nh3: float = np.nan, forecast: bool = False):
+        self.aqi_index = aqi_index
+        self.dt = dt
+        self.co = co
+        self.no = no
+        self.no2 = no2
+        self.o3 = o3
+        self.so2 = so2
+        self.pm2_5 = pm2_5
+        self.pm10 = pm10
+        self.nh3 = nh3
+        # True when this is a forecast hour rather than an observation
+        self.forecast = forecast
+
+    @classmethod
+    def from_entry(cls, entry: Dict, forecast: bool = False) -> 'Reading':
+        """Build from one entry of an air_pollution response's list"""
+        components = entry.get('components') or {}
+        values = {name: float(components[name]) for name in OPENWEATHER_COMPONENTS
+                  if components.get(name) is not None}
+        return cls(entry['main']['aqi'], entry.get('dt'), forecast=forecast, **values)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Reading':
+        """Inverse of to_dict()"""
+        return cls.from_entry({'main': {'aqi': data['aqi_index']}, 'dt': data.get('dt'),
+                               'components': data.get('components')}, data.get('forecast', False))
+
+    def to_dict(self) -> Dict:
+        """JSON-friendly form, used by the on-disk AQI cache"""
+        data = {'aqi_index': self.aqi_index, 'dt': self.dt,
+                'components': {name: value for name, value in self.components.items() if not np.isnan(value)}}
+        if self.forecast:
+            data['forecast'] = True
+        return data
+
+    @property
+    def components(self) -> Dict[str, float]:
+        return {name: getattr(self, name) for name in OPENWEATHER_COMPONENTS}
+
+    def __repr__(self) -> str:
+        return f"Reading(aqi_index={self.aqi_index}, dt={self.dt}, pm2_5={self.pm2_5:.1f}, pm10={self.pm10:.1f})"
+
+def format_concentration(value: float) -> str:
+    """A component concentration for display, or "n/a" if it is missing"""
+    return "n/a" if np.isnan(value) else f"{value:.1f} μg/m³"
+
+def categorize_batch(readings: List[Reading]) -> List[Dict]:
+    """AQIBot.get_aqi_category for many readings at once, with one vectorized EPA computation"""
+    if not readings:
+        return []
+    epa_aqi = compute_epa_aqi({
+        'pm2_5': [reading.pm2_5 for reading in readings],
+        'pm10': [reading.pm10 for reading in readings],
+    })
+    # Anything outside 1-4 is treated as Very Poor, like get_aqi_category
+    indexes = [reading.aqi_index - 1 if reading.aqi_index in (1, 2, 3, 4) else 4 for reading in readings]
+    epa_aqi = clamp_epa_to_category(epa_aqi, indexes)
+    infos = []
+    for index, value in zip(indexes, np.atleast_1d(epa_aqi)):
+        infos.append({'category': AQI_CATEGORIES[index], 'emoji': AQI_CATEGORY_EMOJIS[index],
+                      'epa_aqi': aqi_value(value)})
+    return infos
+
+class AQICache:
+    """TTL + LRU cache of AQI readings keyed by rounded (lat, lon), optionally backed by a JSON file"""
+
+    def __init__(self, ttl: float = DEFAULT_CACHE_TTL, maxsize: int = DEFAULT_CACHE_SIZE,
+                 path: Optional[str] = None, precision: int = GRID_PRECISION):
+        self.ttl = ttl
+        self.path = path
+        self.precision = precision
+        self._entries = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        if path:
+            self._load()
+
+    def _key(self, latitude: float, longitude: float) -> str:
+        return f"{round(latitude, self.precision)},{round(longitude, self.precision)}"
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r') as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable AQI cache file %s: %s", self.path, e, extra={'stage': 'cache'})
+            return
+
+        now = time.time()
+        # Oldest first so the most recent readings end up most recently used
+        for key, entry in sorted(stored.items(), key=lambda item: item[1]['fetched_at']):
+            if now - entry['fetched_at'] < self.ttl:
+                self._entries[key] = (entry['fetched_at'], Reading.from_dict(entry['data']))
+
+    def _save(self) -> None:
+        stored = {key: {'fetched_at': fetched_at, 'data': reading.to_dict()}
+                  for key, (fetched_at, reading) in self._entries.items()}
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(stored, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Failed to write AQI cache file %s: %s", self.path, e, extra={'stage': 'cache'})
+
+    def get(self, latitude: float, longitude: float) -> Optional[Reading]:
+        """Return a cached reading if one is still within the TTL"""
+        key = self._key(latitude, longitude)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            fetched_at, reading = entry
+            if time.time() - fetched_at >= self.ttl:
+                del self._entries[key]
+                return None
+            return reading
+
+    def set(self, latitude: float, longitude: float, reading: Reading) -> None:
+        key = self._key(latitude, longitude)
+        with self._lock:
+            self._entries[key] = (time.time(), reading)
+            if self.path:
+                self._save()
+
+_aqi_cache: Optional[AQICache] = AQICache()
+
+class Forecast:
+    """Hourly air_pollution forecast for one grid cell, held as compact NumPy arrays
+
+    ``timestamps`` (int64, hour starts), ``aqi_index`` (int8) and ``components``
+    (float32, one column per OPENWEATHER_COMPONENTS entry) are aligned by row.
+    """
+
+    def __init__(self, timestamps: np.ndarray, aqi_index: np.ndarray, components: np.ndarray):
+        self.timestamps = timestamps
+        self.aqi_index = aqi_index
+        self.components = components
+
+    @classmethod
+    def from_response(cls, data: Dict) -> 'Forecast':
+        """Parse an air_pollution/forecast (or history) response body, sorted by time"""
+        entries = sorted(data.get('list') or [], key=lambda entry: entry['dt'])
+        timestamps = np.fromiter((entry['dt'] for entry in entries), dtype=np.int64, count=len(entries))
+        aqi_index = np.fromiter((entry['main']['aqi'] for entry in entries), dtype=np.int8, count=len(entries))
+        components = np.array(
+            [[entry['components'].get(name, np.nan) for name in OPENWEATHER_COMPONENTS] for entry in entries],
+            dtype=np.float32
+        ).reshape(len(entries), len(OPENWEATHER_COMPONENTS))
+        return cls(timestamps, aqi_index, components)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def component(self, name: str) -> np.ndarray:
+        return self.components[:, OPENWEATHER_COMPONENTS.index(name)]
+
+    def reading(self, row: int) -> Reading:
+        """One row as the Reading fetch_air_pollution() would return"""
+        components = {name: float(value) for name, value in zip(OPENWEATHER_COMPONENTS, self.components[row])}
+        return Reading(int(self.aqi_index[row]), int(self.timestamps[row]), forecast=True, **components)
+
+    def _row_at(self, ts: float) -> Optional[int]:
+        row = int(np.searchsorted(self.timestamps, ts, side='right')) - 1
+        if row < 0 or ts - self.timestamps[row] >= 3600:
+            return None
+        return row
+
+    def reading_at(self, ts: float) -> Optional[Reading]:
+        """The forecast for the hour containing ``ts``, or None if it isn't covered"""
+        row = self._row_at(ts)
+        return None if row is None else self.reading(row)
+
+    def next_hours(self, hours: int, now: Optional[float] = None) -> 'Forecast':
+        """The slice covering the current hour and the ``hours - 1`` after it"""
+        now = time.time() if now is None else now
+        row = self._row_at(now)
+        if row is None:
+            # Before the first hour: start there; after the last: nothing left
+            row = 0 if len(self) and now < self.timestamps[0] else len(self)
+        window = slice(row, row + max(0, hours))
+        return Forecast(self.timestamps[window], self.aqi_index[window], self.components[window])
+
+    def epa_aqi(self) -> np.ndarray:
+        """EPA AQI for every hour, using all components with a breakpoint table"""
+        if not len(self):
+            return np.empty(0)
+        return compute_epa_aqi({name: self.component(name) for name in EPA_AQI_BREAKPOINTS})
+
+    def peak(self) -> Optional[Tuple[Reading, int]]:
+        """The hour with the highest EPA AQI, plus that AQI; None if no hour has particulate data"""
+        if not len(self):
+            return None
+        aqi = self.epa_aqi()
+        if np.isnan(aqi).all():
+            return None
+        row = int(np.nanargmax(aqi))
+        return self.reading(row), int(aqi[row])
+
+class ForecastCache:
+    """TTL + LRU cache of Forecasts keyed by rounded (lat, lon)"""
+
+    def __init__(self, ttl: float = DEFAULT_FORECAST_TTL, maxsize: int = DEFAULT_CACHE_SIZE,
+                 precision: int = GRID_PRECISION):
+        self.ttl = ttl
+        self.precision = precision
+        self._entries = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def get(self, latitude: float, longitude: float) -> Optional[Forecast]:
+        key = grid_cell(latitude, longitude, self.precision)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            fetched_at, forecast = entry
+            if time.time() - fetched_at >= self.ttl:
+                del self._entries[key]
+                return None
+            return forecast
+
+    def set(self, latitude: float, longitude: float, forecast: Forecast) -> None:
+        with self._lock:
+            self._entries[grid_cell(latitude, longitude, self.precision)] = (time.time(), forecast)
+
+_forecast_cache: Optional[ForecastCache] = None
+
+def configure_forecast(cache: Optional[ForecastCache]) -> None:
+    """Serve current readings from cached hourly forecasts; pass None to always call the current endpoint"""
+    global _forecast_cache
+    _forecast_cache = cache
+
+def configure_cache(cache: Optional[AQICache]) -> None:
+    """Replace the shared AQI cache; pass None to disable caching"""
+    global _aqi_cache
+    _aqi_cache = cache
+
+def validate_tips(candidates: List, count: int) -> List[str]:
+    """Keep up to ``count`` distinct, non-empty tips that fit within TIP_MAX_LENGTH"""
+    tips = []
+    for candidate in candidates:
+        if not isinstance(candidate, str):
+            continue
+        tip = candidate.strip()
+        if not tip or len(tip) > TIP_MAX_LENGTH or tip in tips:
+            continue
+        tips.append(tip)
+    return tips[:count]
+
+class ReadingStore:
+    """Append-only SQLite time series of every AQI reading, indexed by location and time"""
+
+    def __init__(self, path: str = DEFAULT_READINGS_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            columns = ", ".join(f"{name} REAL" for name in OPENWEATHER_COMPONENTS)
+            self._conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS readings (
+                    location TEXT NOT NULL,
+                    ts INTEGER NOT NULL,
+                    fetched_at INTEGER NOT NULL,
+                    aqi_index INTEGER NOT NULL,
+                    {columns},
+                    PRIMARY KEY (location, ts)
+                ) WITHOUT ROWID
+            """)
+            # The primary key serves per-location range scans; this one serves cross-location windows
+            self._conn.execute("CREATE INDEX IF NOT EXISTS readings_ts ON readings (ts)")
+            # Backfill checkpoints: a window is only recorded in the same transaction as its rows
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS backfill_windows (
+                    location TEXT NOT NULL,
+                    start INTEGER NOT NULL,
+                    end INTEGER NOT NULL,
+                    completed_at INTEGER NOT NULL,
+                    rows INTEGER NOT NULL,
+                    PRIMARY KEY (location, start, end)
+                ) WITHOUT ROWID
+            """)
+
+    def append(self, location: str, reading: Reading) -> bool:
+        """Record a reading; returns False if one already exists for this location and timestamp"""
+        fetched_at = int(time.time())
+        ts = reading.dt or fetched_at
+        values = [location, ts, fetched_at, reading.aqi_index]
+        values += [None if np.isnan(value) else value
+                   for value in (getattr(reading, name) for name in OPENWEATHER_COMPONENTS)]
+        placeholders = ", ".join("?" * len(values))
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                f"INSERT OR IGNORE INTO readings (location, ts, fetched_at, aqi_index, "
+                f"{', '.join(OPENWEATHER_COMPONENTS)}) VALUES ({placeholders})",
+                values
+            )
+            return cursor.rowcount > 0
+
+    def append_window(self, location: str, start: int, end: int, series: 'Forecast') -> int:
+        """Store an hourly history window and mark it complete atomically; returns rows inserted"""
+        fetched_at = int(time.time())
+        rows = [
+            (location, int(ts), fetched_at, int(aqi_index), *[None if np.isnan(v) else float(v) for v in values])
+            for ts, aqi_index, values in zip(series.timestamps, series.aqi_index, series.components)
+        ]
+        placeholders = ", ".join("?" * (4 + len(OPENWEATHER_COMPONENTS)))
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                f"INSERT OR IGNORE INTO readings (location, ts, fetched_at, aqi_index, "
+                f"{', '.join(OPENWEATHER_COMPONENTS)}) VALUES ({placeholders})",
+                rows
+            )
+            inserted = self._conn.total_changes - before
+            self._conn.execute(
+                "INSERT OR REPLACE INTO backfill_windows (location, start, end, completed_at, rows) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (location, start, end, fetched_at, inserted)
+            )
+        return inserted
+
+    def completed_windows(self, location: str) -> set:
+        """(start, end) of every backfill window already stored for a location"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT start, end FROM backfill_windows WHERE location = ?", (location,)
+            ).fetchall()
+        return set(rows)
+
+    def query(self, location: str, start: Optional[int] = None, end: Optional[int] = None) -> List[Dict]:
+        """Readings for a location with start <= ts < end (unix seconds), oldest first"""
+        sql = f"SELECT ts, fetched_at, aqi_index, {', '.join(OPENWEATHER_COMPONENTS)} FROM readings WHERE location = ?"
+        params: List = [location]
+        if start is not None:
+            sql += " AND ts >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND ts < ?"
+            params.append(end)
+        sql += " ORDER BY ts"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def latest(self, location: str) -> Optional[Dict]:
+        """Most recent reading stored for a location"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT ts, fetched_at, aqi_index, {', '.join(OPENWEATHER_COMPONENTS)} FROM readings "
+                "WHERE location = ? ORDER BY ts DESC LIMIT 1",
+                (location,)
+            ).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    @staticmethod
+    def _row_to_dict(row: Tuple) -> Dict:
+        ts, fetched_at, aqi_index = row[:3]
+        return {
+            'ts': ts,
+            'fetched_at': fetched_at,
+            'aqi_index': aqi_index,
+            'components': dict(zip(OPENWEATHER_COMPONENTS, row[3:]))
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+_reading_store: Optional[ReadingStore] = None
+
+def configure_reading_store(store: Optional[ReadingStore]) -> None:
+    """Replace the shared reading store; pass None to stop recording readings"""
+    global _reading_store
+    if _reading_store is not None and _reading_store is not store:
+        _reading_store.close()
+    _reading_store = store
+
+class PostState:
+    """Persisted last-posted state per location, used to skip posts that wouldn't say anything new"""
+
+    def __init__(self, path: Optional[str] = DEFAULT_POST_STATE_FILE, min_aqi_delta: int = DEFAULT_MIN_AQI_DELTA,
+                 repost_after_hours: float = DEFAULT_REPOST_AFTER_HOURS):
+        self.path = path
+        self.min_aqi_delta = min_aqi_delta
+        self.repost_after_hours = repost_after_hours
+        self._lock = threading.Lock()
+        self._state: Dict[str, Dict] = {}
+        if path:
+            self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r') as f:
+                self._state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable post state file %s: %s", self.path, e, extra={'stage': 'state'})
+
+    def _save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self._state, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Failed to write post state file %s: %s", self.path, e, extra={'stage': 'state'})
+
+    def should_post(self, location: str, aqi_info: Dict) -> bool:
+        """True if the category changed, the AQI moved enough, or the last post is stale"""
+        with self._lock:
+            last = self._state.get(location)
+        if last is None:
+            return True
+        if last['category'] != aqi_info['category']:
+            return True
+        if last['epa_aqi'] is None or aqi_info['epa_aqi'] is None:
+            # No number to compare; only a change in whether we have one counts
+            if last['epa_aqi'] != aqi_info['epa_aqi']:
+                return True
+        elif abs(last['epa_aqi'] - aqi_info['epa_aqi']) >= self.min_aqi_delta:
+            return True
+        return time.time() - last['posted_at'] >= self.repost_after_hours * 3600
+
+    def record(self, location: str, aqi_info: Dict) -> None:
+        with self._lock:
+            self._state[location] = {
+                'category': aqi_info['category'],
+                'epa_aqi': aqi_info['epa_aqi'],
+                'posted_at': time.time()
+            }
+            if self.path:
+                self._save()
+
+# Configured in __main__ so importing the module doesn't touch the state file
+_post_state: Optional[PostState] = None
+
+def configure_post_state(state: Optional[PostState]) -> None:
+    """Replace the shared post state; pass None to post on every run"""
+    global _post_state
+    _post_state = state
+
+class Outbox:
+    """Durable SQLite queue of composed tweets waiting for delivery"""
+
+    def __init__(self, path: str = DEFAULT_OUTBOX_DB, max_age: Optional[float] = DEFAULT_OUTBOX_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    location TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    aqi_info TEXT
+                )
+            """)
+            # Outboxes created before aqi_info was stored alongside the text
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+            if 'aqi_info' not in columns:
+                self._conn.execute("ALTER TABLE outbox ADD COLUMN aqi_info TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS outbox_ready ON outbox (status, next_attempt_at)")
+            # Anything left mid-delivery by a crash goes back in the queue
+            self._conn.execute("UPDATE outbox SET status = 'pending' WHERE status = 'sending'")
+
+    def enqueue(self, location: str, text: str, aqi_info: Optional[Dict] = None) -> int:
+        """Queue a tweet; ``aqi_info`` is kept so the post state can be updated once it is delivered
+
+        Tweets still waiting for the same location are superseded, so runs that happen before
+        a delivery don't queue one duplicate each.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET status = 'superseded' WHERE location = ? AND status = 'pending'",
+                (location,)
+            )
+            cursor = self._conn.execute(
+                "INSERT INTO outbox (location, text, created_at, next_attempt_at, aqi_info) VALUES (?, ?, ?, ?, ?)",
+                (location, text, now, now, json.dumps(aqi_info) if aqi_info is not None else None)
+            )
+            return cursor.lastrowid
+
+    def claim(self) -> Optional[Dict]:
+        """Mark the oldest ready item as being sent and return it, or None if nothing is due
+
+        Pending items older than ``max_age`` are marked 'expired' rather than returned.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            if self.max_age is not None:
+                expired = self._conn.execute(
+                    "UPDATE outbox SET status = 'expired', last_error = 'expired before delivery' "
+                    "WHERE status = 'pending' AND created_at < ?",
+                    (now - self.max_age,)
+                ).rowcount
+                if expired:
+                    logger.warning("Dropped %d queued tweets older than %.0fs", expired, self.max_age,
+                                   extra={'stage': 'outbox'})
+            row = self._conn.execute(
+                "SELECT id, location, text, attempts, aqi_info FROM outbox "
+                "WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY next_attempt_at, id LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE outbox SET status = 'sending' WHERE id = ?", (row[0],))
+        return {'id': row[0], 'location': row[1], 'text': row[2], 'attempts': row[3],
+                'aqi_info': json.loads(row[4]) if row[4] else None}
+
+    def mark_sent(self, item_id: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE outbox SET status = 'sent', attempts = attempts + 1 WHERE id = ?", (item_id,))
+
+    def mark_failed(self, item_id: int, error: str, retry_at: Optional[float]) -> None:
+        """Schedule another attempt at ``retry_at``, or give up on the item if it is None"""
+        status = 'pending' if retry_at is not None else 'failed'
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, attempts = attempts + 1, next_attempt_at = ?, last_error = ? "
+                "WHERE id = ?",
+                (status, retry_at if retry_at is not None else time.time(), error, item_id)
+            )
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        return dict(rows)
+
+    def outstanding_count(self, before: Optional[float] = None) -> int:
+        """Items not yet sent or given up on, optionally only those due by ``before`` (unix time)"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'sending') AND next_attempt_at <= ?",
+                (before if before is not None else float('inf'),)
+            ).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+_outbox: Optional[Outbox] = None
+
+def configure_outbox(outbox: Optional[Outbox]) -> None:
+    """Queue composed tweets in ``outbox`` instead of posting inline; pass None to post directly"""
+    global _outbox
+    _outbox = outbox
+
+class TipPool:
+    """Daily pool of health tips per AQI category, persisted to disk and served in rotation
+
+    In batch mode the first miss of the day fills every category from a single Gemini call.
+    Fills run outside the pool lock; concurrent misses wait for the fill in flight, and a failed
+    fill isn't retried for ``retry_after`` seconds, so an outage costs one attempt per cooldown.
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_TIP_POOL_FILE, size: int = DEFAULT_TIP_POOL_SIZE,
+                 batch: bool = True, retry_after: float = DEFAULT_TIP_POOL_RETRY_AFTER):
+        self.path = path
+        self.size = size
+        self.batch = batch
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        # Keyed by category, or None for a batch fill of every category
+        self._filling: Dict[Optional[str], threading.Event] = {}
+        self._failed_until: Dict[Optional[str], float] = {}
+        self._state = {'date': None, 'tips': {}, 'cursor': {}}
+        if path:
+            self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r') as f:
+                self._state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable tip pool file %s: %s", self.path, e, extra={'stage': 'gemini'})
+
+    def _save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self._state, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Failed to write tip pool file %s: %s", self.path, e, extra={'stage': 'gemini'})
+
+    def _roll_over(self) -> None:
+        today = date.today().isoformat()
+        if self._state.get('date') != today:
+            self._state = {'date': today, 'tips': {}, 'cursor': {}}
+
+    def get_tip(self, category: str, generate: Callable[[str, int], List[str]],
+                generate_all: Optional[Callable[[int], Dict[str, List[str]]]] = None) -> Optional[str]:
+        """Return the next tip for a category, filling the pool with ``generate`` once per day
+
+        When ``generate_all`` is given and batch mode is on, all categories are filled at once.
+        Returns None if the pool couldn't be filled (or a recent fill failed).
+        """
+        tip = self.next_tip(category)
+        if tip is None and self.batch and generate_all is not None:
+            if not self._fill(None, lambda: generate_all(self.size)):
+                # Gemini just failed (or recently did); the caller's single-tip fallback is the only
+                # call worth making, not another per-category fill on top
+                return None
+            tip = self.next_tip(category)
+        if tip is None:
+            self._fill(category, lambda: {category: generate(category, self.size)})
+            tip = self.next_tip(category)
+        return tip
+
+    def _fill(self, key: Optional[str], produce: Callable[[], Dict[str, List[str]]]) -> bool:
+        """Run one fill for ``key`` without holding the lock; False if it failed or is cooling down"""
+        with self._lock:
+            if self._failed_until.get(key, 0.0) > time.monotonic():
+                return False
+            event = self._filling.get(key)
+            owner = event is None
+            if owner:
+                event = self._filling[key] = threading.Event()
+        if not owner:
+            # Someone else is already asking Gemini; use their result instead of asking again
+            event.wait()
+            with self._lock:
+                return self._failed_until.get(key, 0.0) <= time.monotonic()
+
+        logger.info("Filling tip pool for %s", f"'{key}'" if key else "all categories", extra={'stage': 'gemini'})
+        try:
+            produced = produce()
+        except Exception as e:
+            logger.error("Error filling tip pool: %s", e, extra={'stage': 'gemini', 'error': repr(e)})
+            produced = {}
+        with self._lock:
+            self._roll_over()
+            filled = False
+            for name, tips in produced.items():
+                tips = [tip for tip in tips if tip]
+                if tips and not self._state['tips'].get(name):
+                    self._state['tips'][name] = tips
+                    self._state['cursor'][name] = 0
+                filled = filled or bool(tips)
+            if filled:
+                self._failed_until.pop(key, None)
+            else:
+                self._failed_until[key] = time.monotonic() + self.retry_after
+                logger.warning("Tip pool fill failed, not retrying for %.0fs", self.retry_after,
+                               extra={'stage': 'gemini'})
+            del self._filling[key]
+        event.set()
+        return filled
+
+    def next_tip(self, category: str) -> Optional[str]:
+        """Return the next pooled tip without generating any; None if the category is empty today"""
+        with self._lock:
+            self._roll_over()
+            tips = self._state['tips'].get(category)
+            return self._take(category, tips) if tips else None
+
+    def _take(self, category: str, tips: List[str]) -> str:
+        cursor = self._state['cursor'].get(category, 0)
+        tip = tips[cursor % len(tips)]
+        self._state['cursor'][category] = (cursor + 1) % len(tips)
+        if self.path:
+            self._save()
+        return tip
+
+# Configured in __main__ so importing the module doesn't touch the pool file
+_tip_pool: Optional[TipPool] = None
+
+def configure_tip_pool(pool: Optional[TipPool]) -> None:
+    """Replace the shared tip pool; pass None to call Gemini for every tweet"""
+    global _tip_pool
+    _tip_pool = pool
+
+class TwitterClientRegistry:
+    """Lazily built tweepy clients cached per credential set, so their HTTP sessions are reused"""
+
+    def __init__(self):
+        self._clients: Dict[Tuple[str, ...], 'tweepy.Client'] = {}
+        self._apis: Dict[Tuple[str, ...], 'tweepy.API'] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(credentials: Dict[str, str]) -> Tuple[str, ...]:
+        return (
+            credentials['api_key'],
+            credentials['api_secret'],
+            credentials['access_token'],
+            credentials['access_token_secret']
+        )
+
+    def get_client(self, credentials: Dict[str, str]) -> 'tweepy.Client':
+        """Return the v2 client for these credentials, creating it on first use"""
+        key = self._key(credentials)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                import tweepy
+                client = tweepy.Client(
+                    consumer_key=key[0],
+                    consumer_secret=key[1],
+                    access_token=key[2],
+                    access_token_secret=key[3]
+                )
+                self._clients[key] = client
+            return client
+
+    def get_api(self, credentials: Dict[str, str]) -> 'tweepy.API':
+        """Return the v1 API for these credentials, creating it only when the fallback needs it"""
+        key = self._key(credentials)
+        with self._lock:
+            api = self._apis.get(key)
+            if api is None:
+                import tweepy
+                api = tweepy.API(tweepy.OAuth1UserHandler(*key))
+                self._apis[key] = api
+            return api
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clients.clear()
+            self._apis.clear()
+
+_twitter_clients = TwitterClientRegistry()
 
 @dataclass
 class Location:
@@ -18,86 +1571,470 @@ class Location:
     twitter_credentials: Dict[str, str]
     openweather_api_key: str
     gemini_api_key: str
+    schedule: Optional[Dict] = None
+    rate_limits: Optional[Dict] = None
+
+class OutputSink(ABC):
+    """Destination for composed tweets; send() returns True once the text is delivered"""
+    name = 'sink'
+
+    @abstractmethod
+    def send(self, location: Location, tweet: str, log: logging.LoggerAdapter) -> bool:
+        ...
+
+    def close(self) -> None:
+        pass
+
+class TwitterSink(OutputSink):
+    """Posts to the location's account, trying the v2 API first and v1 as a fallback"""
+    name = 'twitter'
+
+    def send(self, location: Location, tweet: str, log: logging.LoggerAdapter) -> bool:
+        tweet_bytes = len(tweet.encode('utf-8'))
+        started = time.perf_counter()
+        try:
+            # Reuse the v2 client (and its HTTP session) for this credential set
+            client_v2 = _twitter_clients.get_client(location.twitter_credentials)
+            
+            # Try posting with v2 client first (preferred method)
+            with timed_stage(location.name, 'post') as record:
+                record['bytes'] = tweet_bytes
+                rate_limiters.acquire('twitter', location.twitter_credentials['access_token'])
+                # Dependency latency excludes client setup and time spent waiting on our own rate limiter
+                request_started = time.perf_counter()
+                result = client_v2.create_tweet(text=tweet)
+            metrics.observe('aqibot_dependency_latency_seconds', time.perf_counter() - request_started,
+                            dependency='twitter')
+            metrics.inc('aqibot_posts_total', location=location.name, api='v2')
+            tweet_id = result.data['id']
+            log.info("Tweet posted with ID %s", tweet_id,
+                     extra={'stage': 'post', 'duration_ms': elapsed_ms(started)})
+            return True
+
+        except RateLimitTimeout as e:
+            # The v1 fallback shares the same bucket, so it would only wait out the same limit
+            log.error("Not posting, %s", e,
+                      extra={'stage': 'post', 'duration_ms': elapsed_ms(started), 'error': repr(e)})
+            metrics.inc('aqibot_failures_total', stage='post')
+            return False
+        except Exception as e:
+            log.warning("Error posting tweet: %s", e,
+                        extra={'stage': 'post', 'duration_ms': elapsed_ms(started), 'error': repr(e)})
+            
+            # Try using v1 API as fallback
+            metrics.inc('aqibot_post_fallbacks_total', location=location.name)
+            started = time.perf_counter()
+            try:
+                log.info("Attempting to post using v1 API as fallback", extra={'stage': 'post_fallback'})
+                api_v1 = _twitter_clients.get_api(location.twitter_credentials)
+                with timed_stage(location.name, 'post_fallback') as record:
+                    record['bytes'] = tweet_bytes
+                    rate_limiters.acquire('twitter', location.twitter_credentials['access_token'])
+                    request_started = time.perf_counter()
+                    status = api_v1.update_status(tweet)
+                metrics.observe('aqibot_dependency_latency_seconds', time.perf_counter() - request_started,
+                                dependency='twitter')
+                metrics.inc('aqibot_posts_total', location=location.name, api='v1')
+                log.info("Tweet posted via v1 API with ID %s", status.id,
+                         extra={'stage': 'post_fallback', 'duration_ms': elapsed_ms(started)})
+                return True
+            except Exception as e2:
+                log.error("V1 API fallback also failed: %s", e2,
+                          extra={'stage': 'post_fallback', 'duration_ms': elapsed_ms(started), 'error': repr(e2)})
+                metrics.inc('aqibot_failures_total', stage='post')
+                return False
+
+class LocalSink(OutputSink):
+    """Base for sinks that never touch the network; times and counts deliveries like real posts"""
+
+    def send(self, location: Location, tweet: str, log: logging.LoggerAdapter) -> bool:
+        with timed_stage(location.name, 'post') as record:
+            record['bytes'] = len(tweet.encode('utf-8'))
+            self.write({'ts': time.time(), 'location': location.name, 'text': tweet})
+        metrics.inc('aqibot_posts_total', location=location.name, api=self.name)
+        log.info("Tweet written to %s sink", self.name, extra={'stage': 'post'})
+        return True
+
+    @abstractmethod
+    def write(self, entry: Dict) -> None:
+        ...
+
+class StdoutSink(LocalSink):
+    name = 'stdout'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def write(self, entry: Dict) -> None:
+        with self._lock:
+            print(f"[{entry['location']}] {entry['text']}\n", flush=True)
+
+class JSONLSink(LocalSink):
+    """Appends one JSON object per tweet to a file"""
+    name = 'jsonl'
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, entry: Dict) -> None:
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+class MemorySink(LocalSink):
+    """Keeps every tweet in a list, for benchmarks and load tests"""
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.entries: List[Dict] = []
+
+    def write(self, entry: Dict) -> None:
+        with self._lock:
+            self.entries.append(entry)
+
+_sink: OutputSink = TwitterSink()
+
+def configure_sink(sink: OutputSink) -> None:
+    """Send tweets to ``sink`` instead of Twitter"""
+    global _sink
+    _sink = sink
+
+def parse_air_pollution(data: Dict) -> Optional[Reading]:
+    """Extract the current reading from an air_pollution response, or None if it has none"""
+    # Check if 'list' key exists in response
+    if 'list' not in data or not data['list']:
+        return None
+    return Reading.from_entry(data['list'][0])
+
+def handle_openweather_response(status: int, body: bytes, parse: Callable[[Dict], object], endpoint: str,
+                                stats: Dict, log_fields: Dict, started: float):
+    """Shared status, size and parsing checks for an OpenWeatherMap air pollution response
+
+    Returns ``parse(data)``, or None (logged and counted as an error) if the request failed
+    or ``parse`` found nothing usable. Success logging and metrics are left to the caller.
+    """
+    log_fields.update(status=status, duration_ms=elapsed_ms(started), retries=stats.get('retries', 0))
+    stats['bytes'] = len(body)
+    # Only render the body when debug logging is actually enabled
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("OpenWeatherMap %s response", endpoint,
+                     extra={**log_fields, 'payload': body.decode('utf-8', 'replace')})
+
+    if status != 200:
+        logger.error("OpenWeatherMap %s error: status code %s", endpoint, status, extra=log_fields)
+        metrics.inc('aqibot_fetches_total', result='error')
+        return None
+
+    data = json.loads(body)
+    result = parse(data)
+    if result is None:
+        logger.error("Unexpected OpenWeatherMap %s response", endpoint, extra={**log_fields, 'payload': data})
+        metrics.inc('aqibot_fetches_total', result='error')
+    return result
+
+def log_fetch_error(error: Exception, endpoint: str, log_fields: Dict, started: float) -> None:
+    """Log and count an OpenWeatherMap request that raised instead of returning a response"""
+    logger.error("Error fetching OpenWeatherMap %s data: %s", endpoint, error,
+                 extra={**log_fields, 'duration_ms': elapsed_ms(started), 'error': repr(error)})
+    metrics.inc('aqibot_fetches_total', result='error')
+
+def fetch_air_pollution(latitude: float, longitude: float, api_key: str,
+                        stats: Optional[Dict] = None) -> Optional[Reading]:
+    """Fetch current AQI data for a coordinate from OpenWeatherMap API
+
+    ``stats``, if given, is filled with the response size and whether the cache answered.
+    """
+    if stats is None:
+        stats = {}
+    cache = _aqi_cache
+    if cache is not None:
+        cached = cache.get(latitude, longitude)
+        if cached is not None:
+            stats['cached'] = True
+            metrics.inc('aqibot_fetches_total', result='cached')
+            logger.debug("Using cached AQI data", extra={'stage': 'fetch', 'lat': latitude, 'lon': longitude})
+            return cached
+
+    if _forecast_cache is not None:
+        forecast = fetch_air_pollution_forecast(latitude, longitude, api_key, stats)
+        reading = forecast.reading_at(time.time()) if forecast is not None else None
+        if reading is not None:
+            metrics.inc('aqibot_fetches_total', result='cached')
+            return reading
+        logger.info("No forecast for the current hour, fetching current conditions",
+                    extra={'stage': 'fetch', 'lat': latitude, 'lon': longitude})
+
+    url = OPENWEATHER_AIR_POLLUTION_URL
+    
+    params = {
+        'lat': latitude,
+        'lon': longitude,
+        'appid': api_key
+    }
+    
+    log_fields = {'stage': 'fetch', 'lat': latitude, 'lon': longitude}
+    started = time.perf_counter()
+    try:
+        response = get_with_retry(url, params, stats, log_fields)
+        result = handle_openweather_response(response.status_code, response.content, parse_air_pollution,
+                                             'current', stats, log_fields, started)
+    except Exception as e:
+        log_fetch_error(e, 'current', log_fields, started)
+        return None
+    if result is None:
+        return None
+    if cache is not None:
+        cache.set(latitude, longitude, result)
+    logger.info("Fetched AQI data", extra=log_fields)
+    metrics.inc('aqibot_fetches_total', result='ok')
+    return result
+
+@asynccontextmanager
+async def async_http_session(limit: int = DEFAULT_ASYNC_CONCURRENCY) -> AsyncIterator:
+    """Shared aiohttp session for the asyncio pipeline, with at most ``limit`` open connections"""
+    # Imported here so the threaded paths don't pay for it at startup
+    import aiohttp
+    connector = aiohttp.TCPConnector(limit=limit, force_close=not _http_config.keep_alive)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        yield session
+
+async def fetch_air_pollution_async(latitude: float, longitude: float, api_key: str, session,
+                                    stats: Optional[Dict] = None) -> Optional[Reading]:
+    """Coroutine version of fetch_air_pollution() over an aiohttp session
+
+    With the forecast cache on, hours it covers are answered inline; only a forecast
+    refetch (once every few hours per cell) runs in a worker thread.
+    """
+    if stats is None:
+        stats = {}
+    # Same lookup order as fetch_air_pollution(): AQI cache, then forecast, then the API
+    cache = _aqi_cache
+    if cache is not None:
+        cached = cache.get(latitude, longitude)
+        if cached is not None:
+            stats['cached'] = True
+            metrics.inc('aqibot_fetches_total', result='cached')
+            return cached
+    forecast_cache = _forecast_cache
+    if forecast_cache is not None:
+        forecast = forecast_cache.get(latitude, longitude)
+        reading = forecast.reading_at(time.time()) if forecast is not None else None
+        if reading is not None:
+            metrics.inc('aqibot_fetches_total', result='cached')
+            return reading
+        return await asyncio.to_thread(fetch_air_pollution, latitude, longitude, api_key, stats)
+
+    params = {'lat': latitude, 'lon': longitude, 'appid': api_key}
+    log_fields = {'stage': 'fetch', 'lat': latitude, 'lon': longitude}
+    started = time.perf_counter()
+    try:
+        status, body = await get_with_retry_async(session, OPENWEATHER_AIR_POLLUTION_URL, params, stats, log_fields)
+        result = handle_openweather_response(status, body, parse_air_pollution, 'current', stats, log_fields, started)
+    except Exception as e:
+        log_fetch_error(e, 'current', log_fields, started)
+        return None
+    if result is None:
+        return None
+    if cache is not None:
+        cache.set(latitude, longitude, result)
+    logger.info("Fetched AQI data", extra=log_fields)
+    metrics.inc('aqibot_fetches_total', result='ok')
+    return result
+
+def fetch_air_pollution_forecast(latitude: float, longitude: float, api_key: str,
+                                 stats: Optional[Dict] = None) -> Optional[Forecast]:
+    """Fetch (or reuse) the hourly air pollution forecast for a coordinate"""
+    if stats is None:
+        stats = {}
+    cache = _forecast_cache
+    if cache is not None:
+        forecast = cache.get(latitude, longitude)
+        if forecast is not None:
+            stats['cached'] = True
+            return forecast
+
+    params = {'lat': latitude, 'lon': longitude, 'appid': api_key}
+    log_fields = {'stage': 'fetch', 'lat': latitude, 'lon': longitude, 'endpoint': 'forecast'}
+    started = time.perf_counter()
+    try:
+        response = get_with_retry(f"{OPENWEATHER_AIR_POLLUTION_URL}/forecast", params, stats, log_fields)
+        # An empty forecast is as useless as a malformed one
+        forecast = handle_openweather_response(response.status_code, response.content,
+                                               lambda data: Forecast.from_response(data) or None,
+                                               'forecast', stats, log_fields, started)
+    except Exception as e:
+        log_fetch_error(e, 'forecast', log_fields, started)
+        return None
+    if forecast is None:
+        return None
+    if cache is not None:
+        cache.set(latitude, longitude, forecast)
+    logger.info("Fetched %d-hour forecast", len(forecast), extra=log_fields)
+    metrics.inc('aqibot_fetches_total', result='forecast')
+    return forecast
+
+def fetch_air_pollution_history(latitude: float, longitude: float, api_key: str, start: int, end: int,
+                                stats: Optional[Dict] = None) -> Optional[Forecast]:
+    """Fetch hourly historical readings for start <= ts < end (unix seconds)"""
+    if stats is None:
+        stats = {}
+    params = {'lat': latitude, 'lon': longitude, 'start': start, 'end': end, 'appid': api_key}
+    log_fields = {'stage': 'backfill', 'lat': latitude, 'lon': longitude, 'start': start, 'end': end}
+    started = time.perf_counter()
+    try:
+        response = get_with_retry(f"{OPENWEATHER_AIR_POLLUTION_URL}/history", params, stats, log_fields)
+        history = handle_openweather_response(response.status_code, response.content, Forecast.from_response,
+                                              'history', stats, log_fields, started)
+    except Exception as e:
+        log_fetch_error(e, 'history', log_fields, started)
+        return None
+    if history is None:
+        return None
+    logger.debug("Fetched %d hours of history", len(history), extra=log_fields)
+    metrics.inc('aqibot_fetches_total', result='history')
+    return history
+
+def grid_cell(latitude: float, longitude: float, precision: int = GRID_PRECISION) -> Tuple[float, float]:
+    """Round coordinates to the grid cell OpenWeatherMap resolves them to"""
+    return (round(latitude, precision), round(longitude, precision))
+
+def group_by_cell(locations: List[Location],
+                  precision: int = GRID_PRECISION) -> Dict[Tuple[float, float], List[Location]]:
+    """Group locations by grid cell, so each cell needs only one request"""
+    cells: Dict[Tuple[float, float], List[Location]] = {}
+    for location in locations:
+        cells.setdefault(grid_cell(location.latitude, location.longitude, precision), []).append(location)
+    return cells
+
+def record_shared_fetch(members: List[Location], data: Optional[Reading], stats: Dict, duration_ms: float) -> None:
+    """Add a fetch entry to the run report for every location that waited on one cell's request"""
+    report = _run_report
+    if report is None:
+        return
+    for location in members:
+        report.add({
+            'location': location.name, 'stage': 'fetch', 'ok': data is not None,
+            'retries': stats.get('retries', 0), 'bytes': stats.get('bytes', 0),
+            'duration_ms': duration_ms, 'shared_with': len(members)
+        })
+
+def fetch_aqi_batch(locations: List[Location], concurrency: int = DEFAULT_CONCURRENCY,
+                    precision: int = GRID_PRECISION) -> Dict[str, Optional[Reading]]:
+    """Fetch AQI data for many locations, issuing one request per grid cell"""
+    cells = group_by_cell(locations, precision)
+
+    logger.info("Fetching AQI for %d locations across %d grid cells", len(locations), len(cells),
+                extra={'stage': 'fetch'})
+
+    def fetch_cell(cell: Tuple[float, float], api_key: str) -> Tuple[Optional[Reading], Dict, float]:
+        stats: Dict = {}
+        started = time.perf_counter()
+        data = fetch_air_pollution(cell[0], cell[1], api_key, stats)
+        return data, stats, elapsed_ms(started)
+
+    cell_data: Dict[Tuple[float, float], Optional[Reading]] = {}
+    if cells:
+        max_workers = max(1, min(concurrency, len(cells)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(fetch_cell, cell, members[0].openweather_api_key): cell
+                for cell, members in cells.items()
+            }
+            for future in as_completed(futures):
+                cell = futures[future]
+                data, stats, duration = future.result()
+                cell_data[cell] = data
+                record_shared_fetch(cells[cell], data, stats, duration)
+
+    # Readings are immutable, so every location in a cell can share the same one
+    return {location.name: cell_data[cell] for cell, members in cells.items() for location in members}
+
+def load_genai(api_key: str):
+    """Import and configure the Gemini SDK on first use
+
+    Set GEMINI_API_ENDPOINT to talk to a proxy or local stand-in over REST instead of gRPC.
+    """
+    import google.generativeai as genai
+    endpoint = os.getenv('GEMINI_API_ENDPOINT')
+    if endpoint:
+        genai.configure(api_key=api_key, transport='rest', client_options={'api_endpoint': endpoint})
+    else:
+        genai.configure(api_key=api_key)
+    return genai
+
+async def generate_content_async(model, *args, **kwargs):
+    """Await a Gemini generate_content call without blocking the event loop
+
+    The SDK's native async call only works over gRPC, so the REST transport used with
+    GEMINI_API_ENDPOINT runs the blocking call in a worker thread instead.
+    """
+    if os.getenv('GEMINI_API_ENDPOINT'):
+        return await asyncio.to_thread(model.generate_content, *args, **kwargs)
+    return await model.generate_content_async(*args, **kwargs)
+
+def caring_message_prompt(aqi_category: str) -> str:
+    """Gemini prompt for a single health tip, shared by the sync and async bots"""
+    return f"""
+    Create a very short, caring health tip (max {TIP_MAX_LENGTH} characters) for people based on this air quality:
+    AQI Category: {aqi_category}
+    
+    The message should be helpful, caring, and brief - something like reminding people to wear masks, 
+    stay indoors, or other appropriate precautions for this air quality level. 
+    Don't include any prefixes like "Tip:" or "Health advice:". Just the direct message.
+    """
 
 class AQIBot:
     def __init__(self, location: Location):
         self.location = location
-        # Configure Gemini API
-        genai.configure(api_key=location.gemini_api_key)
+        self.logger = LocationLogger(logger, {'location': location.name})
 
-    def get_aqi_openweather(self) -> Optional[Dict]:
+    def gemini_model(self):
+        """Gemini model client for this location's API key"""
+        return load_genai(self.location.gemini_api_key).GenerativeModel(GEMINI_MODEL)
+
+    def get_aqi_openweather(self) -> Optional[Reading]:
         """Fetch AQI data from OpenWeatherMap API"""
-        url = "http://api.openweathermap.org/data/2.5/air_pollution"
-        
-        params = {
-            'lat': self.location.latitude,
-            'lon': self.location.longitude,
-            'appid': self.location.openweather_api_key
-        }
-        
-        try:
-            response = requests.get(url, params=params)
-            
-            # Print the status code and response for debugging
-            print(f"Status code: {response.status_code}")
-            print(f"Response content: {response.text}")
-            
-            # Check if request was successful
-            if response.status_code != 200:
-                print(f"API error: Status code {response.status_code}")
-                return None
-            
-            data = response.json()
-            
-            # Check if 'list' key exists in response
-            if 'list' not in data or not data['list']:
-                print(f"Unexpected API response format: {data}")
-                return None
-            
-            # OpenWeatherMap uses a different AQI scale (1-5)
-            aqi_index = data['list'][0]['main']['aqi']
-            
-            # Get pollutant values
-            pollutants = data['list'][0]['components']
-            pm25 = pollutants.get('pm2_5', 0)
-            pm10 = pollutants.get('pm10', 0)
-            
-            # Return both the index and raw values
-            return {
-                'aqi_index': aqi_index,
-                'pm25': pm25,
-                'pm10': pm10
-            }
-        except Exception as e:
-            print(f"Error fetching AQI: {e}")
-            print(f"Full exception: {repr(e)}")
-            return None
+        with timed_stage(self.location.name, 'fetch') as record:
+            data = fetch_air_pollution(
+                self.location.latitude,
+                self.location.longitude,
+                self.location.openweather_api_key,
+                record
+            )
+            record['ok'] = data is not None
+        return data
+
+    def get_aqi_forecast(self, hours: int) -> Optional[Forecast]:
+        """Hourly forecast for the next ``hours`` hours, from the forecast cache when possible"""
+        forecast = fetch_air_pollution_forecast(
+            self.location.latitude,
+            self.location.longitude,
+            self.location.openweather_api_key
+        )
+        return forecast.next_hours(hours) if forecast is not None else None
 
-    def get_aqi_category(self, aqi_index: int, pm25: float) -> Dict:
+    def get_aqi_category(self, aqi_index: int, pm25: float, pm10: Optional[float] = None) -> Dict:
         """Convert OpenWeatherMap AQI (1-5) to category and US EPA equivalent"""
         # OpenWeatherMap AQI: 1=Good, 2=Fair, 3=Moderate, 4=Poor, 5=Very Poor
         
-        if aqi_index == 1:
-            category = "Good"
-            emoji = "🟢"
-            # Approximate EPA AQI value based on PM2.5
-            epa_aqi = min(int(pm25 * 4.8), 50)
-        elif aqi_index == 2:
-            category = "Fair"
-            emoji = "🟢"
-            epa_aqi = min(50 + int((pm25 - 10) * 4.8), 100)
-        elif aqi_index == 3:
-            category = "Moderate"
-            emoji = "🟡"
-            epa_aqi = min(100 + int((pm25 - 25) * 1.8), 150)
-        elif aqi_index == 4:
-            category = "Poor"
-            emoji = "🟠"
-            epa_aqi = min(150 + int((pm25 - 50) * 1.8), 200)
-        else:  # aqi_index == 5
-            category = "Very Poor"
-            emoji = "🔴"
-            epa_aqi = min(200 + int((pm25 - 75) * 2.8), 300)
+        index = aqi_index - 1 if aqi_index in (1, 2, 3, 4) else 4  # else: 5 = Very Poor
+        category = AQI_CATEGORIES[index]
+        emoji = AQI_CATEGORY_EMOJIS[index]
+        
+        # EPA AQI from the particulate readings using the official breakpoint tables (None if both are missing),
+        # kept within the category's range so the tweet doesn't contradict itself
+        components = {'pm2_5': pm25}
+        if pm10 is not None:
+            components['pm10'] = pm10
+        epa_aqi = aqi_value(clamp_epa_to_category(compute_epa_aqi(components), index))
         
         return {
             'category': category,
@@ -108,28 +2045,109 @@ class AQIBot:
     def get_caring_message_from_gemini(self, aqi_category: str) -> str:
         """Fetch a caring health tip from Gemini based on AQI category"""
         try:
-            model = genai.GenerativeModel('gemini-2.0-flash')
+            model = self.gemini_model()
+            prompt = caring_message_prompt(aqi_category)
+            rate_limiters.acquire('gemini', self.location.gemini_api_key)
+            # Dependency latency excludes time spent waiting on our own rate limiter
+            started = time.perf_counter()
+            response = model.generate_content(prompt)
+            message = response.text.strip()
+            metrics.observe('aqibot_dependency_latency_seconds', time.perf_counter() - started, dependency='gemini')
+            self.logger.info("Generated health tip", extra={'stage': 'gemini', 'duration_ms': elapsed_ms(started)})
+            
+            # Ensure the message is not too long for Twitter
+            # if len(message) > 70:
+            #     message = message[:67] + "..."
+                
+            return message
+        except Exception as e:
+            self.logger.error("Error getting message from Gemini: %s", e, extra={'stage': 'gemini', 'error': repr(e)})
+            metrics.inc('aqibot_failures_total', stage='gemini')
+            return FALLBACK_CARING_MESSAGE
+
+    def get_caring_messages_from_gemini(self, aqi_category: str, count: int) -> List[str]:
+        """Fetch several distinct health tips for one AQI category in a single Gemini call"""
+        try:
+            model = self.gemini_model()
             
             prompt = f"""
-            Create a very short, caring health tip (max 70 characters) for people based on this air quality:
+            Create {count} different very short, caring health tips (max 70 characters each) for people based on this air quality:
             AQI Category: {aqi_category}
             
-            The message should be helpful, caring, and brief - something like reminding people to wear masks, 
+            Each message should be helpful, caring, and brief - something like reminding people to wear masks, 
             stay indoors, or other appropriate precautions for this air quality level. 
-            Don't include any prefixes like "Tip:" or "Health advice:". Just the direct message.
+            Put each tip on its own line with no numbering, bullets or prefixes like "Tip:".
             """
             
+            rate_limiters.acquire('gemini', self.location.gemini_api_key)
+            started = time.perf_counter()
             response = model.generate_content(prompt)
-            message = response.text.strip()
+            metrics.observe('aqibot_dependency_latency_seconds', time.perf_counter() - started, dependency='gemini')
+            self.logger.info("Generated tips for '%s'", aqi_category,
+                             extra={'stage': 'gemini', 'duration_ms': elapsed_ms(started)})
+            tips = [line.strip().lstrip('-*•0123456789.) ') for line in response.text.splitlines()]
+            return validate_tips(tips, count)
+        except Exception as e:
+            self.logger.error("Error getting messages from Gemini: %s", e, extra={'stage': 'gemini', 'error': repr(e)})
+            metrics.inc('aqibot_failures_total', stage='gemini')
+            return []
+
+    def get_all_caring_messages_from_gemini(self, count: int) -> Dict[str, List[str]]:
+        """Fetch ``count`` health tips for every AQI category in one structured Gemini call"""
+        try:
+            model = self.gemini_model()
             
-            # Ensure the message is not too long for Twitter
-            # if len(message) > 70:
-            #     message = message[:67] + "..."
-                
-            return message
+            prompt = f"""
+            Create {count} different very short, caring health tips (max {TIP_MAX_LENGTH} characters each) for people
+            for each of these air quality categories: {", ".join(AQI_CATEGORIES)}.
+            
+            Each message should be helpful, caring, and brief - something like reminding people to wear masks, 
+            stay indoors, or other appropriate precautions for that air quality level. 
+            Don't include any prefixes like "Tip:" or "Health advice:".
+            
+            Respond with only a JSON object mapping each category name exactly as written above
+            to a list of {count} tip strings.
+            """
+            
+            rate_limiters.acquire('gemini', self.location.gemini_api_key)
+            started = time.perf_counter()
+            response = model.generate_content(
+                prompt,
+                generation_config={'response_mime_type': 'application/json'}
+            )
+            metrics.observe('aqibot_dependency_latency_seconds', time.perf_counter() - started, dependency='gemini')
+            self.logger.info("Generated tips for all categories",
+                             extra={'stage': 'gemini', 'duration_ms': elapsed_ms(started)})
+            data = json.loads(response.text)
+            if not isinstance(data, dict):
+                self.logger.error("Unexpected tip response format from Gemini",
+                                  extra={'stage': 'gemini', 'payload': response.text})
+                return {}
+            
+            table = {}
+            for category in AQI_CATEGORIES:
+                candidates = data.get(category)
+                tips = validate_tips(candidates if isinstance(candidates, list) else [], count)
+                if len(tips) < count:
+                    self.logger.warning("Gemini returned %d/%d usable tips for '%s'", len(tips), count, category,
+                                        extra={'stage': 'gemini'})
+                table[category] = tips
+            return table
         except Exception as e:
-            print(f"Error getting message from Gemini: {e}")
-            return "Stay safe and take appropriate precautions for today's air quality."
+            self.logger.error("Error getting batched messages from Gemini: %s", e,
+                              extra={'stage': 'gemini', 'error': repr(e)})
+            metrics.inc('aqibot_failures_total', stage='gemini')
+            return {}
+
+    def get_caring_message(self, aqi_category: str) -> str:
+        """Get a health tip from the daily tip pool, calling Gemini directly only if the pool is unavailable"""
+        pool = _tip_pool
+        if pool is not None:
+            tip = pool.get_tip(aqi_category, self.get_caring_messages_from_gemini,
+                               self.get_all_caring_messages_from_gemini)
+            if tip:
+                return tip
+        return self.get_caring_message_from_gemini(aqi_category)
 
     def get_local_time(self) -> str:
         """Get current time in the specified timezone"""
@@ -137,96 +2155,217 @@ class AQIBot:
         local_time = datetime.now(timezone)
         return local_time.strftime("%I:%M %p")
 
-    def post_tweet(self, aqi_data: Dict) -> bool:
-        """Post AQI update to Twitter"""
-        print(f"Posting tweet for {self.location.name}...")
-        
+    def compose_tweet(self, reading: Reading, aqi_info: Optional[Dict] = None) -> str:
+        """Build the tweet text for a reading, including the health tip"""
         # Get AQI category information
-        aqi_info = self.get_aqi_category(aqi_data['aqi_index'], aqi_data['pm25'])
+        if aqi_info is None:
+            aqi_info = self.get_aqi_category(reading.aqi_index, reading.pm2_5, reading.pm10)
         
-        # Get caring message from Gemini
-        caring_message = self.get_caring_message_from_gemini(aqi_info['category'])
+        # Get caring message from the tip pool (filled from Gemini once per day)
+        with timed_stage(self.location.name, 'gemini') as record:
+            caring_message = self.get_caring_message(aqi_info['category'])
+            record['bytes'] = len(caring_message.encode('utf-8'))
         
+        return self.format_tweet(reading, aqi_info, caring_message)
+
+    def format_tweet(self, reading: Reading, aqi_info: Dict, caring_message: str) -> str:
+        """Lay out the tweet text from a reading, its category and a health tip"""
         # Get local time for the specified location
         current_time = self.get_local_time()
         
         # Create tweet text
         tweet = f"Air Quality Index for {self.location.name} at {current_time}:\n\n"
         tweet += f"Status: {aqi_info['category']} {aqi_info['emoji']}\n"
-        tweet += f"Air Quality Index: ~{aqi_info['epa_aqi']}\n"
-        tweet += f"PM2.5: {aqi_data['pm25']:.1f} μg/m³\n"
-        tweet += f"PM10: {aqi_data['pm10']:.1f} μg/m³\n\n"
+        # A value OpenWeatherMap didn't report is shown as "n/a" rather than a made-up number
+        epa_aqi = aqi_info['epa_aqi']
+        tweet += f"Air Quality Index: {'n/a' if epa_aqi is None else f'~{epa_aqi}'}\n"
+        tweet += f"PM2.5: {format_concentration(reading.pm2_5)}\n"
+        tweet += f"PM10: {format_concentration(reading.pm10)}\n\n"
         tweet += f"💡 {caring_message}"
         
-        # Print the tweet content for debugging
-        print(f"Tweet content: {tweet}")
-        print(f"Tweet length: {len(tweet)} characters")
-        
+        # Only dump the tweet body when debug logging is enabled
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Tweet content", extra={'stage': 'post', 'payload': tweet, 'length': len(tweet)})
+        return tweet
+
+    def post_tweet(self, reading: Reading, aqi_info: Optional[Dict] = None) -> bool:
+        """Post AQI update to Twitter"""
+        self.logger.info("Posting tweet", extra={'stage': 'post'})
+        return self.send_tweet(self.compose_tweet(reading, aqi_info))
+
+    def send_tweet(self, tweet: str) -> bool:
+        """Send already composed text through the configured output sink"""
+        return _sink.send(self.location, tweet, self.logger)
+
+    def record_reading(self, reading: Reading) -> None:
+        """Append the reading to the shared time-series store, if one is configured"""
+        store = _reading_store
+        # Only observed conditions go in the time series
+        if store is None or reading.forecast:
+            return
         try:
-            # Get location-specific Twitter credentials
-            api_key = self.location.twitter_credentials['api_key']
-            api_secret = self.location.twitter_credentials['api_secret']
-            access_token = self.location.twitter_credentials['access_token']
-            access_token_secret = self.location.twitter_credentials['access_token_secret']
-            
-            print(f"Using Twitter credentials for {self.location.name}")
-            
-            # Create authentication handler for v1 API (needed for some operations)
-            auth = tweepy.OAuth1UserHandler(
-                api_key,
-                api_secret,
-                access_token,
-                access_token_secret
-            )
-            
-            # Create both v1 and v2 clients
-            api_v1 = tweepy.API(auth)
-            client_v2 = tweepy.Client(
-                consumer_key=api_key,
-                consumer_secret=api_secret,
-                access_token=access_token,
-                access_token_secret=access_token_secret
-            )
-            
-            # Try posting with v2 client first (preferred method)
-            result = client_v2.create_tweet(text=tweet)
-            tweet_id = result.data['id']
-            print(f"Tweet successfully posted for {self.location.name} with ID: {tweet_id}")
+            if not store.append(self.location.name, reading):
+                self.logger.debug("Reading at %s already stored", reading.dt, extra={'stage': 'store'})
+        except sqlite3.Error as e:
+            self.logger.error("Failed to store reading: %s", e, extra={'stage': 'store'})
+
+    def categorize(self, reading: Reading) -> Dict:
+        """Categorize a reading and publish its gauges"""
+        with timed_stage(self.location.name, 'categorize'):
+            aqi_info = self.get_aqi_category(reading.aqi_index, reading.pm2_5, reading.pm10)
+        self.publish_gauges(reading, aqi_info)
+        return aqi_info
+
+    def publish_gauges(self, reading: Reading, aqi_info: Dict) -> None:
+        # Leave a gauge at its last value rather than export a missing reading
+        if not np.isnan(reading.pm2_5):
+            metrics.set('aqibot_pm25', reading.pm2_5, location=self.location.name)
+        if not np.isnan(reading.pm10):
+            metrics.set('aqibot_pm10', reading.pm10, location=self.location.name)
+        if aqi_info['epa_aqi'] is not None:
+            metrics.set('aqibot_aqi', aqi_info['epa_aqi'], location=self.location.name)
+        metrics.set('aqibot_openweather_aqi_index', reading.aqi_index, location=self.location.name)
+
+    def is_unchanged(self, aqi_info: Dict) -> bool:
+        """True if the post state says this reading isn't worth a new post"""
+        state = _post_state
+        if state is not None and not state.should_post(self.location.name, aqi_info):
+            self.logger.info("AQI unchanged (%s, ~%s), skipping post", aqi_info['category'], aqi_info['epa_aqi'],
+                             extra={'stage': 'categorize'})
             return True
-            
-        except Exception as e:
-            print(f"Error posting tweet for {self.location.name}: {e}")
-            print(f"Full exception: {repr(e)}")
-            
-            # Try using v1 API as fallback
+        return False
+
+    def deliver(self, tweet: str, aqi_info: Dict) -> bool:
+        """Queue or post a composed tweet, remembering what was posted once it is sent"""
+        state = _post_state
+        outbox = _outbox
+        if outbox is not None:
+            # Hand the composed post to the delivery worker instead of waiting on Twitter here
             try:
-                print(f"Attempting to post for {self.location.name} using v1 API as fallback...")
-                status = api_v1.update_status(tweet)
-                print(f"Tweet posted via v1 API with ID: {status.id}")
-                return True
-            except Exception as e2:
-                print(f"V1 API fallback also failed for {self.location.name}: {e2}")
+                outbox.enqueue(self.location.name, tweet, aqi_info)
+            except sqlite3.Error as e:
+                self.logger.error("Failed to queue tweet: %s", e, extra={'stage': 'outbox'})
                 return False
+            # The post state is updated by the outbox worker once the tweet is actually sent
+            self.logger.info("Tweet queued for delivery", extra={'stage': 'outbox'})
+            return True
+        
+        # Post to Twitter
+        self.logger.info("Posting tweet", extra={'stage': 'post'})
+        success = self.send_tweet(tweet)
+        if success:
+            if state is not None:
+                state.record(self.location.name, aqi_info)
+            self.logger.info("Process completed successfully")
+            return True
+        else:
+            self.logger.error("Failed to post tweet", extra={'stage': 'post'})
+            return False
+
+    def update_aqi(self, reading: Optional[Reading] = None) -> bool:
+        """Main function to fetch AQI data and post tweet
 
-    def update_aqi(self) -> bool:
-        """Main function to fetch AQI data and post tweet"""
-        print(f"Fetching AQI data for {self.location.name}...")
-        aqi_data = self.get_aqi_openweather()
+        Pass ``reading`` to reuse one from fetch_aqi_batch() instead of fetching again.
+        """
+        if reading is None:
+            self.logger.info("Fetching AQI data", extra={'stage': 'fetch'})
+            reading = self.get_aqi_openweather()
         
-        if aqi_data:
-            print(f"AQI data fetched successfully for {self.location.name}.")
-            # Post to Twitter
-            success = self.post_tweet(aqi_data)
-            if success:
-                print(f"Process completed successfully for {self.location.name}.")
+        if reading:
+            self.logger.info("AQI data fetched successfully", extra={'stage': 'fetch'})
+            self.record_reading(reading)
+            
+            # Skip the Gemini and Twitter calls entirely if nothing meaningful changed
+            aqi_info = self.categorize(reading)
+            if self.is_unchanged(aqi_info):
                 return True
-            else:
-                print(f"Failed to post tweet for {self.location.name}.")
-                return False
+            
+            tweet = self.compose_tweet(reading, aqi_info)
+            return self.deliver(tweet, aqi_info)
         else:
-            print(f"Failed to fetch AQI data for {self.location.name}.")
+            self.logger.error("Failed to fetch AQI data", extra={'stage': 'fetch'})
+            metrics.inc('aqibot_failures_total', stage='fetch')
             return False
 
+class AsyncAQIBot(AQIBot):
+    """AQIBot whose fetch, message and post stages are coroutines, for run_locations_async()"""
+
+    async def get_aqi_openweather_async(self, session) -> Optional[Reading]:
+        """Fetch AQI data from OpenWeatherMap over the shared aiohttp session"""
+        with timed_stage(self.location.name, 'fetch') as record:
+            data = await fetch_air_pollution_async(
+                self.location.latitude,
+                self.location.longitude,
+                self.location.openweather_api_key,
+                session,
+                record
+            )
+            record['ok'] = data is not None
+        return data
+
+    async def get_caring_message_from_gemini_async(self, aqi_category: str) -> str:
+        """Fetch a caring health tip from Gemini without blocking the event loop"""
+        try:
+            model = self.gemini_model()
+            prompt = caring_message_prompt(aqi_category)
+            await rate_limiters.acquire_async('gemini', self.location.gemini_api_key)
+            started = time.perf_counter()
+            response = await generate_content_async(model, prompt)
+            message = response.text.strip()
+            metrics.observe('aqibot_dependency_latency_seconds', time.perf_counter() - started, dependency='gemini')
+            self.logger.info("Generated health tip", extra={'stage': 'gemini', 'duration_ms': elapsed_ms(started)})
+            return message
+        except Exception as e:
+            self.logger.error("Error getting message from Gemini: %s", e, extra={'stage': 'gemini', 'error': repr(e)})
+            metrics.inc('aqibot_failures_total', stage='gemini')
+            return FALLBACK_CARING_MESSAGE
+
+    async def get_caring_message_async(self, aqi_category: str) -> str:
+        """Serve pooled tips inline; only the once-a-day pool fill runs in a worker thread"""
+        pool = _tip_pool
+        if pool is not None:
+            tip = pool.next_tip(aqi_category)
+            if tip is None:
+                tip = await asyncio.to_thread(pool.get_tip, aqi_category, self.get_caring_messages_from_gemini,
+                                              self.get_all_caring_messages_from_gemini)
+            if tip:
+                return tip
+        return await self.get_caring_message_from_gemini_async(aqi_category)
+
+    async def compose_tweet_async(self, reading: Reading, aqi_info: Dict) -> str:
+        with timed_stage(self.location.name, 'gemini') as record:
+            caring_message = await self.get_caring_message_async(aqi_info['category'])
+            record['bytes'] = len(caring_message.encode('utf-8'))
+        return self.format_tweet(reading, aqi_info, caring_message)
+
+    async def update_aqi_async(self, session=None, reading: Optional[Reading] = None) -> bool:
+        """Coroutine version of update_aqi()
+
+        Posting (tweepy, or the outbox's SQLite write) has no async client, so it runs in a worker thread.
+        Without ``session`` a short-lived one is opened for the fetch.
+        """
+        if reading is None:
+            self.logger.info("Fetching AQI data", extra={'stage': 'fetch'})
+            if session is None:
+                async with async_http_session(1) as own_session:
+                    reading = await self.get_aqi_openweather_async(own_session)
+            else:
+                reading = await self.get_aqi_openweather_async(session)
+        
+        if not reading:
+            self.logger.error("Failed to fetch AQI data", extra={'stage': 'fetch'})
+            metrics.inc('aqibot_failures_total', stage='fetch')
+            return False
+        
+        # SQLite blocks, so keep it off the event loop
+        await asyncio.to_thread(self.record_reading, reading)
+        aqi_info = self.categorize(reading)
+        if self.is_unchanged(aqi_info):
+            return True
+        
+        tweet = await self.compose_tweet_async(reading, aqi_info)
+        return await asyncio.to_thread(self.deliver, tweet, aqi_info)
+
 def load_location_config(config_file: str) -> list[Location]:
     """Load location configurations from a JSON file"""
     # Load environment variables
@@ -239,6 +2378,9 @@ def load_location_config(config_file: str) -> list[Location]:
     with open(config_file, 'r') as f:
         config_data = json.load(f)
     
+    # Provider-wide client-side rate limits
+    configure_rate_limits(config_data.get('rate_limits', {}))
+    
     locations = []
     for config in config_data['locations']:
         location_name = config['name']
@@ -254,8 +2396,8 @@ def load_location_config(config_file: str) -> list[Location]:
         
         # Check if credentials are available
         if not all(twitter_credentials.values()):
-            print(f"Warning: Missing Twitter credentials for {location_name}")
-            print(f"Using values from config file for {location_name}")
+            logger.warning("Missing Twitter credentials in environment, using values from config file",
+                           extra={'location': location_name, 'stage': 'config'})
             twitter_credentials = config['twitter_credentials']
         
         location = Location(
@@ -265,23 +2407,753 @@ def load_location_config(config_file: str) -> list[Location]:
             timezone=config['timezone'],
             twitter_credentials=twitter_credentials,
             openweather_api_key=openweather_api_key,
-            gemini_api_key=gemini_api_key
+            gemini_api_key=gemini_api_key,
+            schedule=config.get('schedule'),
+            rate_limits=config.get('rate_limits')
         )
+        if location.rate_limits:
+            shared = sorted(provider for provider in location.rate_limits if provider != 'twitter')
+            if shared:
+                # These keys are shared, so the last location in the file would set the limit for all of them
+                logger.warning("Ignoring per-location rate limits for %s; set them in the top-level "
+                               "\"rate_limits\" block", ", ".join(shared), extra={'location': location_name})
+            # Only the Twitter account is this location's own credential
+            configure_rate_limits(location.rate_limits, {'twitter': twitter_credentials['access_token']})
         locations.append(location)
     
     return locations
 
+def report_fetch_failure(location: Location) -> None:
+    """Log and count a location whose reading couldn't be fetched"""
+    logger.error("Failed to fetch AQI data", extra={'location': location.name, 'stage': 'fetch'})
+    metrics.inc('aqibot_failures_total', stage='fetch')
+
+def process_location(location: Location, reading: Optional[Reading] = None) -> bool:
+    """Run a full AQI update for a single location"""
+    # Only log the first 4 chars of the key for security
+    logger.info("Processing location", extra={'location': location.name,
+                                              'twitter_api_key': f"{location.twitter_credentials['api_key'][:4]}..."})
+    try:
+        bot = AQIBot(location)
+        return bot.update_aqi(reading)
+    except Exception:
+        logger.exception("Unhandled error while processing location", extra={'location': location.name})
+        return False
+
+def run_locations(locations: List[Location], concurrency: int = DEFAULT_CONCURRENCY) -> Dict[str, bool]:
+    """Process locations concurrently and return per-location success flags"""
+    results = {}
+    if not locations:
+        return results
+
+    # Fetch every location up front so nearby points share a single request
+    prefetched = fetch_aqi_batch(locations, concurrency=concurrency)
+
+    # A failed cell fetch already used its retries and deadline; don't repeat them per location
+    for location in locations:
+        if prefetched.get(location.name) is None:
+            report_fetch_failure(location)
+            results[location.name] = False
+    fetched = [location for location in locations if location.name not in results]
+
+    max_workers = max(1, min(concurrency, len(fetched) or 1))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(process_location, location, prefetched[location.name]): location
+            for location in fetched
+        }
+        for future in as_completed(futures):
+            results[futures[future].name] = future.result()
+
+    # Keep the results in config order for a stable summary
+    return {location.name: results[location.name] for location in locations}
+
+async def run_locations_async(locations: List[Location],
+                              concurrency: int = DEFAULT_ASYNC_CONCURRENCY) -> Dict[str, bool]:
+    """Process every location on one event loop, at most ``concurrency`` at a time
+
+    Like run_locations(), locations sharing a grid cell share one fetch.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    cells = group_by_cell(locations)
+
+    async with async_http_session(concurrency) as session:
+        async def fetch_cell(cell: Tuple[float, float], members: List[Location]) -> Optional[Reading]:
+            stats: Dict = {}
+            async with semaphore:
+                started = time.perf_counter()
+                data = await fetch_air_pollution_async(cell[0], cell[1], members[0].openweather_api_key,
+                                                       session, stats)
+            record_shared_fetch(members, data, stats, elapsed_ms(started))
+            return data
+
+        async def process(location: Location, reading: Optional[Reading]) -> bool:
+            if reading is None:
+                # The shared cell fetch already used its retries; don't fetch again per location
+                report_fetch_failure(location)
+                return False
+            async with semaphore:
+                try:
+                    return await AsyncAQIBot(location).update_aqi_async(session, reading)
+                except Exception:
+                    logger.exception("Unhandled error while processing location", extra={'location': location.name})
+                    return False
+
+        fetched = await asyncio.gather(*(fetch_cell(cell, members) for cell, members in cells.items()))
+        cell_data = dict(zip(cells, fetched))
+        outcomes = await asyncio.gather(*(
+            process(location, cell_data[grid_cell(location.latitude, location.longitude)])
+            for location in locations
+        ))
+    return {location.name: ok for location, ok in zip(locations, outcomes)}
+
+class StageStats:
+    """Throughput, busy time and queue depth of one pipelined stage"""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.batches = 0
+        self.busy = 0.0
+        self.max_depth = 0
+        self._depth_total = 0
+        self._lock = threading.Lock()
+
+    def record(self, items: int, busy: float, depth: int) -> None:
+        with self._lock:
+            self.items += items
+            self.batches += 1
+            self.busy += busy
+            self.max_depth = max(self.max_depth, depth)
+            self._depth_total += depth
+        metrics.inc('aqibot_pipeline_items_total', items, stage=self.name)
+        metrics.set('aqibot_pipeline_queue_depth', depth, stage=self.name)
+
+    def summary(self, wall: float) -> Dict:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'items': self.items,
+                'batches': self.batches,
+                'throughput_per_s': round(self.items / wall, 2) if wall > 0 else None,
+                # Share of the stage's worker time spent working rather than waiting on a queue
+                'utilization': round(self.busy / (wall * self.workers), 3) if wall > 0 else None,
+                'max_queue_depth': self.max_depth,
+                'mean_queue_depth': round(self._depth_total / self.batches, 1) if self.batches else 0.0
+            }
+
+class StagedPipeline:
+    """fetch → categorize → compose → post as separate worker pools joined by bounded queues
+
+    A slow stage only backs up its own queue, so Twitter latency doesn't hold up fetches
+    for the next locations. Categorization takes whatever has queued up (up to
+    ``batch_size``) and scores it in one vectorized call.
+    """
+    _STOP = object()
+
+    def __init__(self, workers: Optional[Dict[str, int]] = None, queue_size: int = DEFAULT_PIPELINE_QUEUE_SIZE,
+                 batch_size: int = DEFAULT_CATEGORIZE_BATCH):
+        self.workers = {**DEFAULT_PIPELINE_WORKERS, **(workers or {})}
+        self.queue_size = queue_size
+        self.batch_size = max(1, batch_size)
+        self.stats: Dict[str, StageStats] = {}
+        self.wall = 0.0
+        self._results: Dict[str, bool] = {}
+
+    def run(self, locations: List[Location]) -> Dict[str, bool]:
+        """Process every location and return per-location success flags in config order"""
+        self._results = {}
+        self.stats = {stage: StageStats(stage, max(1, self.workers[stage])) for stage in PIPELINE_STAGES}
+        handlers = {'fetch': self._fetch, 'categorize': self._categorize,
+                    'compose': self._compose, 'post': self._post}
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in PIPELINE_STAGES]
+        started = time.perf_counter()
+
+        threads: List[List[threading.Thread]] = []
+        for i, stage in enumerate(PIPELINE_STAGES):
+            outbox = queues[i + 1] if i + 1 < len(queues) else None
+            pool = []
+            for n in range(self.stats[stage].workers):
+                thread = threading.Thread(target=self._work, name=f"pipeline-{stage}-{n}", daemon=True,
+                                          args=(self.stats[stage], handlers[stage], queues[i], outbox,
+                                                stage == 'categorize'))
+                thread.start()
+                pool.append(thread)
+            threads.append(pool)
+
+        # Locations sharing a grid cell share a single fetch, as in run_locations()
+        for item in group_by_cell(locations).items():
+            queues[0].put(item)
+
+        # Shut down stage by stage: once a stage's workers exit, nothing more reaches the next queue
+        for i, pool in enumerate(threads):
+            for _ in pool:
+                queues[i].put(self._STOP)
+            for thread in pool:
+                thread.join()
+
+        self.wall = time.perf_counter() - started
+        return {location.name: self._results.get(location.name, False) for location in locations}
+
+    def _work(self, stats: StageStats, handler: Callable[[List], List], inbox: queue.Queue,
+              outbox: Optional[queue.Queue], batch: bool) -> None:
+        stop = False
+        while not stop:
+            item = inbox.get()
+            if item is self._STOP:
+                return
+            items = [item]
+            while batch and len(items) < self.batch_size:
+                try:
+                    item = inbox.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    # Finish this batch, then exit like any other worker
+                    stop = True
+                    break
+                items.append(item)
+
+            depth = inbox.qsize()
+            started = time.perf_counter()
+            try:
+                outputs = handler(items)
+            except Exception:
+                logger.exception("Unhandled error in %s stage", stats.name, extra={'stage': stats.name})
+                outputs = []
+            stats.record(len(items), time.perf_counter() - started, depth)
+            # Blocks while the next stage is saturated, which is what keeps memory bounded
+            for output in outputs:
+                outbox.put(output)
+
+    def _fail(self, name: str) -> None:
+        self._results[name] = False
+
+    def _fetch(self, items: List[Tuple[Tuple[float, float], List[Location]]]) -> List:
+        outputs = []
+        for cell, members in items:
+            stats: Dict = {}
+            started = time.perf_counter()
+            data = fetch_air_pollution(cell[0], cell[1], members[0].openweather_api_key, stats)
+            record_shared_fetch(members, data, stats, elapsed_ms(started))
+            for location in members:
+                if data is None:
+                    report_fetch_failure(location)
+                    self._fail(location.name)
+                else:
+                    outputs.append((AQIBot(location), data))
+        return outputs
+
+    def _categorize(self, items: List[Tuple[AQIBot, Reading]]) -> List:
+        started = time.perf_counter()
+        infos = categorize_batch([reading for _, reading in items])
+        duration = round(elapsed_ms(started) / len(items), 3)
+        report = _run_report
+        outputs = []
+        for (bot, reading), aqi_info in zip(items, infos):
+            if report is not None:
+                report.add({'location': bot.location.name, 'stage': 'categorize', 'ok': True, 'retries': 0,
+                            'bytes': 0, 'duration_ms': duration, 'batch_size': len(items)})
+            bot.record_reading(reading)
+            bot.publish_gauges(reading, aqi_info)
+            if bot.is_unchanged(aqi_info):
+                self._results[bot.location.name] = True
+            else:
+                outputs.append((bot, reading, aqi_info))
+        return outputs
+
+    def _compose(self, items: List[Tuple[AQIBot, Reading, Dict]]) -> List:
+        outputs = []
+        for bot, reading, aqi_info in items:
+            try:
+                outputs.append((bot, bot.compose_tweet(reading, aqi_info), aqi_info))
+            except Exception:
+                bot.logger.exception("Failed to compose tweet", extra={'stage': 'gemini'})
+                self._fail(bot.location.name)
+        return outputs
+
+    def _post(self, items: List[Tuple[AQIBot, str, Dict]]) -> List:
+        for bot, tweet, aqi_info in items:
+            try:
+                self._results[bot.location.name] = bot.deliver(tweet, aqi_info)
+            except Exception:
+                bot.logger.exception("Failed to deliver tweet", extra={'stage': 'post'})
+                self._fail(bot.location.name)
+        return []
+
+    def summary(self) -> Dict[str, Dict]:
+        return {stage: self.stats[stage].summary(self.wall) for stage in PIPELINE_STAGES if stage in self.stats}
+
+    def format_stats(self) -> str:
+        """Per-stage table for tuning worker counts and queue size"""
+        lines = [f"{'stage':<12}{'workers':>8}{'items':>8}{'items/s':>10}{'util':>8}{'max q':>8}{'mean q':>8}"]
+        for stage, info in self.summary().items():
+            lines.append(f"{stage:<12}{info['workers']:>8}{info['items']:>8}"
+                         f"{info['throughput_per_s'] or 0:>10.1f}{info['utilization'] or 0:>8.2f}"
+                         f"{info['max_queue_depth']:>8}{info['mean_queue_depth']:>8.1f}")
+        lines.append(f"Pipeline wall time: {self.wall * 1000:.1f} ms (queue size {self.queue_size})")
+        return "\n".join(lines)
+
+def run_locations_pipelined(locations: List[Location], workers: Optional[Dict[str, int]] = None,
+                            queue_size: int = DEFAULT_PIPELINE_QUEUE_SIZE) -> Tuple[Dict[str, bool], StagedPipeline]:
+    """Process locations through a StagedPipeline; also returns the pipeline for its stage stats"""
+    pipeline = StagedPipeline(workers=workers, queue_size=queue_size)
+    return pipeline.run(locations), pipeline
+
+def backfill_windows(start: int, end: int, window_days: float = DEFAULT_BACKFILL_WINDOW_DAYS) -> List[Tuple[int, int]]:
+    """Split [start, end) into consecutive windows of at most ``window_days``"""
+    step = max(3600, int(window_days * 86400))
+    return [(window_start, min(window_start + step, end)) for window_start in range(start, end, step)]
+
+def backfill(locations: List[Location], start: int, end: int, store: ReadingStore,
+             window_days: float = DEFAULT_BACKFILL_WINDOW_DAYS,
+             concurrency: int = DEFAULT_CONCURRENCY) -> Dict[str, Dict[str, int]]:
+    """Load history for [start, end) into ``store``, skipping windows a previous run completed
+
+    Windows are fetched concurrently but still go through the OpenWeatherMap rate limiter,
+    and each one is written as soon as it arrives, so memory stays at ``concurrency`` windows.
+    Locations sharing a grid cell share each request. A failed window is simply left
+    unmarked and retried by the next run.
+    """
+    windows = backfill_windows(start, end, window_days)
+    cells = group_by_cell(locations)
+
+    summary = {location.name: {'windows': len(windows), 'skipped': 0, 'done': 0, 'failed': 0, 'rows': 0}
+               for location in locations}
+    tasks = []
+    for cell, members in cells.items():
+        done = {location.name: store.completed_windows(location.name) for location in members}
+        for window in windows:
+            pending = [location for location in members if window not in done[location.name]]
+            for location in members:
+                if location not in pending:
+                    summary[location.name]['skipped'] += 1
+            if pending:
+                tasks.append((cell, window, pending))
+
+    logger.info("Backfilling %d windows for %d locations (%d already done)", len(tasks), len(locations),
+                sum(entry['skipped'] for entry in summary.values()), extra={'stage': 'backfill'})
+
+    def run_window(cell: Tuple[float, float], window: Tuple[int, int],
+                   members: List[Location]) -> Optional[Dict[str, int]]:
+        history = fetch_air_pollution_history(cell[0], cell[1], members[0].openweather_api_key, *window)
+        if history is None:
+            return None
+        # Store under every member's name so each one's checkpoints stay independent
+        return {location.name: store.append_window(location.name, window[0], window[1], history)
+                for location in members}
+
+    if tasks:
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(tasks)))) as executor:
+            futures = {executor.submit(run_window, *task): task for task in tasks}
+            for completed, future in enumerate(as_completed(futures), 1):
+                _, window, members = futures[future]
+                try:
+                    rows = future.result()
+                except sqlite3.Error as e:
+                    logger.error("Failed to store backfill window: %s", e,
+                                 extra={'stage': 'backfill', 'start': window[0]})
+                    rows = None
+                for location in members:
+                    entry = summary[location.name]
+                    if rows is None:
+                        entry['failed'] += 1
+                    else:
+                        entry['done'] += 1
+                        entry['rows'] += rows[location.name]
+                if completed % 50 == 0 or completed == len(tasks):
+                    logger.info("Backfill progress: %d/%d windows", completed, len(tasks),
+                                extra={'stage': 'backfill'})
+    return summary
+
+def print_run_summary(results: Dict[str, bool]) -> None:
+    """Print a final summary of a multi-location run"""
+    succeeded = [name for name, ok in results.items() if ok]
+    failed = [name for name, ok in results.items() if not ok]
+
+    print("\n--- Run summary ---")
+    for name, ok in results.items():
+        print(f"{name}: {'OK' if ok else 'FAILED'}")
+    print(f"{len(succeeded)}/{len(results)} locations updated successfully.")
+    if failed:
+        print(f"Failed locations: {', '.join(failed)}")
+
+class OutboxWorker:
+    """Background threads that drain the outbox, retrying failed posts with backoff"""
+
+    def __init__(self, outbox: Outbox, bots: Dict[str, AQIBot], workers: int = DEFAULT_OUTBOX_WORKERS,
+                 max_attempts: int = DEFAULT_OUTBOX_MAX_ATTEMPTS, retry_policy: Optional[RetryPolicy] = None,
+                 poll_interval: float = 1.0):
+        self.outbox = outbox
+        self.bots = bots
+        self.workers = max(1, workers)
+        self.max_attempts = max_attempts
+        self.retry_policy = retry_policy or RetryPolicy(base_delay=30.0, max_delay=1800.0)
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> 'OutboxWorker':
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._loop, name=f"outbox-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                delivered = self.deliver_one()
+            except Exception:
+                logger.exception("Outbox delivery error", extra={'stage': 'outbox'})
+                delivered = False
+            if not delivered:
+                self._stop.wait(self.poll_interval)
+
+    def deliver_one(self) -> bool:
+        """Send the next due item; returns False if there was nothing to send"""
+        item = self.outbox.claim()
+        if item is None:
+            return False
+        bot = self.bots.get(item['location'])
+        if bot is None:
+            logger.error("No configured location for queued tweet", extra={'location': item['location'], 'stage': 'outbox'})
+            self.outbox.mark_failed(item['id'], "unknown location", None)
+            return True
+
+        error = "delivery failed"
+        try:
+            sent = bot.send_tweet(item['text'])
+        except Exception as e:
+            # A raising sink must not leave the row claimed ('sending') forever
+            logger.exception("Output sink raised while delivering queued tweet",
+                             extra={'location': item['location'], 'stage': 'outbox'})
+            sent, error = False, repr(e)
+        if sent:
+            self.outbox.mark_sent(item['id'])
+            state = _post_state
+            if state is not None and item['aqi_info'] is not None:
+                state.record(item['location'], item['aqi_info'])
+            return True
+
+        attempts = item['attempts'] + 1
+        if attempts >= self.max_attempts:
+            logger.error("Giving up on queued tweet after %d attempts", attempts,
+                         extra={'location': item['location'], 'stage': 'outbox'})
+            self.outbox.mark_failed(item['id'], error, None)
+        else:
+            delay = self.retry_policy.backoff(attempts)
+            logger.warning("Queued tweet failed, retrying in %.0fs", delay,
+                           extra={'location': item['location'], 'stage': 'outbox', 'retries': attempts})
+            self.outbox.mark_failed(item['id'], error, time.time() + delay)
+        return True
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until nothing is left to deliver; True if the outbox drained in time
+
+        Retries scheduled within the timeout are waited for; later ones stay queued for the next run.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        due_by = None if timeout is None else time.time() + timeout
+        while self.outbox.outstanding_count(due_by) > 0:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+        return self.outbox.outstanding_count() == 0
+
+    def stop(self) -> None:
+        """Stop after in-flight deliveries finish; unsent items stay queued for the next start"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+class AQIDaemon:
+    """Long-running scheduler that keeps one warm AQIBot per location and fires updates on schedule"""
+
+    def __init__(self, locations: List[Location], concurrency: int = DEFAULT_CONCURRENCY,
+                 metrics_file: Optional[str] = None, outbox_workers: int = DEFAULT_OUTBOX_WORKERS):
+        self.bots = {location.name: AQIBot(location) for location in locations}
+        self.metrics_file = metrics_file
+        self.outbox_worker = OutboxWorker(_outbox, self.bots, workers=outbox_workers) if _outbox else None
+        self.scheduler = schedule.Scheduler()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+        self._stop = threading.Event()
+        self._running = set()
+        self._running_lock = threading.Lock()
+
+        for location in locations:
+            self._schedule_location(location)
+
+    def _schedule_location(self, location: Location) -> None:
+        spec = location.schedule or DEFAULT_SCHEDULE
+        if 'every_minutes' in spec:
+            self.scheduler.every(int(spec['every_minutes'])).minutes.do(self._submit, location.name)
+            logger.info("Scheduled every %s minutes", spec['every_minutes'], extra={'location': location.name})
+        elif 'every_hours' in spec:
+            self.scheduler.every(int(spec['every_hours'])).hours.do(self._submit, location.name)
+            logger.info("Scheduled every %s hours", spec['every_hours'], extra={'location': location.name})
+        elif 'at' in spec:
+            times = spec['at'] if isinstance(spec['at'], list) else [spec['at']]
+            for time_str in times:
+                # Daily times are interpreted in the location's own timezone
+                self.scheduler.every().day.at(time_str, location.timezone).do(self._submit, location.name)
+            logger.info("Scheduled daily at %s (%s)", ', '.join(times), location.timezone,
+                        extra={'location': location.name})
+        else:
+            raise ValueError(f"Unsupported schedule for {location.name}: {spec}")
+
+    def _submit(self, name: str) -> None:
+        # Skip a tick rather than stacking runs if the previous update is still in flight
+        with self._running_lock:
+            if name in self._running:
+                logger.warning("Skipping tick, previous update still running", extra={'location': name})
+                return
+            self._running.add(name)
+        self.executor.submit(self._run, name)
+
+    def _run(self, name: str) -> None:
+        try:
+            logger.info("Scheduled update", extra={'location': name})
+            self.bots[name].update_aqi()
+        except Exception:
+            logger.exception("Unhandled error in scheduled update", extra={'location': name})
+        finally:
+            with self._running_lock:
+                self._running.discard(name)
+            if self.metrics_file:
+                write_metrics_textfile(self.metrics_file)
+
+    def stop(self, *_) -> None:
+        """Request a graceful shutdown; in-flight updates are allowed to finish"""
+        if not self._stop.is_set():
+            logger.info("Shutdown requested, waiting for in-flight updates")
+        self._stop.set()
+
+    def run_forever(self, run_on_start: bool = False) -> None:
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        if self.outbox_worker is not None:
+            self.outbox_worker.start()
+
+        if run_on_start:
+            for name in self.bots:
+                self._submit(name)
+
+        try:
+            while not self._stop.is_set():
+                self.scheduler.run_pending()
+                idle = self.scheduler.idle_seconds
+                # Wake at least once a second so shutdown requests are noticed promptly
+                self._stop.wait(1.0 if idle is None else min(max(idle, 0.0), 1.0))
+        finally:
+            self.scheduler.clear()
+            self.executor.shutdown(wait=True)
+            if self.outbox_worker is not None:
+                self.outbox_worker.stop()
+            # Drop pooled connections before exiting
+            configure_http(_http_config)
+            logger.info("Daemon stopped")
+
+def parse_stage_workers(value: str) -> Dict[str, int]:
+    """Parse "fetch=8,post=4" into per-stage worker counts"""
+    workers = {}
+    for pair in filter(None, value.split(',')):
+        stage, _, count = pair.partition('=')
+        stage = stage.strip()
+        if stage not in PIPELINE_STAGES or not count.strip().isdigit():
+            raise argparse.ArgumentTypeError(f"Invalid stage worker count: {pair!r}")
+        workers[stage] = int(count)
+    return workers
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Post air quality updates for configured locations")
+    parser.add_argument('--config', default='config.json', help="Path to the locations config file")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="Number of locations to process in parallel (1 = sequential)")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="Minimum log level; DEBUG also dumps API responses and tweet bodies")
+    parser.add_argument('--log-format', default='json', choices=['json', 'text'],
+                        help="Log as JSON lines or plain text")
+    parser.add_argument('--report', default=None,
+                        help="Write a JSON report of per-stage timings to this path")
+    parser.add_argument('--metrics-file', default=None,
+                        help="Write Prometheus metrics to this textfile-collector path")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="In daemon mode, serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument('--daemon', action='store_true',
+                        help="Keep running and post on each location's schedule instead of once")
+    parser.add_argument('--run-on-start', action='store_true',
+                        help="In daemon mode, update every location immediately before waiting for schedules")
+    parser.add_argument('--pool-size', type=int, default=HTTPConfig.pool_size,
+                        help="Maximum pooled HTTP connections per host")
+    parser.add_argument('--no-keep-alive', action='store_true',
+                        help="Close HTTP connections after every request")
+    parser.add_argument('--connect-timeout', type=float, default=HTTPConfig.connect_timeout,
+                        help="HTTP connect timeout in seconds")
+    parser.add_argument('--read-timeout', type=float, default=HTTPConfig.read_timeout,
+                        help="HTTP read timeout in seconds")
+    parser.add_argument('--fetch-attempts', type=int, default=RetryPolicy.attempts,
+                        help="Maximum OpenWeatherMap attempts per location")
+    parser.add_argument('--fetch-deadline', type=float, default=RetryPolicy.deadline,
+                        help="Seconds one location's fetch may take including retries")
+    parser.add_argument('--cache-ttl', type=float, default=DEFAULT_CACHE_TTL,
+                        help="Seconds an AQI reading stays cached (0 disables the cache)")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                        help="Maximum number of grid cells kept in the AQI cache")
+    parser.add_argument('--cache-file', default=None,
+                        help="JSON file to persist the AQI cache across runs")
+    parser.add_argument('--forecast', action='store_true',
+                        help="Serve current readings from the hourly forecast, refetched every --forecast-ttl")
+    parser.add_argument('--forecast-ttl', type=float, default=DEFAULT_FORECAST_TTL,
+                        help="Seconds a fetched forecast is reused")
+    parser.add_argument('--backfill', nargs=2, metavar=('START', 'END'), type=date.fromisoformat, default=None,
+                        help="Load hourly history from START up to END (YYYY-MM-DD, UTC) into the readings "
+                             "database instead of posting; an interrupted backfill resumes where it stopped")
+    parser.add_argument('--backfill-window-days', type=float, default=DEFAULT_BACKFILL_WINDOW_DAYS,
+                        help="Days of history requested per call")
+    parser.add_argument('--readings-db', default=DEFAULT_READINGS_DB,
+                        help="SQLite file every fetched reading is appended to")
+    parser.add_argument('--no-readings-db', action='store_true',
+                        help="Don't record readings")
+    parser.add_argument('--post-state-file', default=DEFAULT_POST_STATE_FILE,
+                        help="JSON file remembering what was last posted for each location")
+    parser.add_argument('--min-aqi-delta', type=int, default=DEFAULT_MIN_AQI_DELTA,
+                        help="Repost an unchanged category once the EPA AQI moves by at least this much")
+    parser.add_argument('--repost-after-hours', type=float, default=DEFAULT_REPOST_AFTER_HOURS,
+                        help="Repost an unchanged reading once the last post is this old")
+    parser.add_argument('--always-post', action='store_true',
+                        help="Post on every run even if the AQI hasn't changed")
+    parser.add_argument('--asyncio', action='store_true',
+                        help="Process locations on a single asyncio event loop instead of a thread pool")
+    parser.add_argument('--async-concurrency', type=int, default=DEFAULT_ASYNC_CONCURRENCY,
+                        help="Maximum locations in flight at once with --asyncio")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="Run fetch, categorize, compose and post as separate stages joined by bounded queues")
+    parser.add_argument('--stage-workers', type=parse_stage_workers, default=None,
+                        help="Pipeline worker counts as stage=N pairs, e.g. fetch=8,compose=2,post=8")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_PIPELINE_QUEUE_SIZE,
+                        help="Items buffered between pipeline stages")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Run the full pipeline but print tweets instead of posting them "
+                             "(post state is left untouched)")
+    parser.add_argument('--dry-run-file', default=None,
+                        help="With --dry-run, append tweets to this JSONL file instead of printing them")
+    parser.add_argument('--outbox', default=None, nargs='?', const=DEFAULT_OUTBOX_DB,
+                        help=f"Queue tweets in a durable SQLite outbox (default {DEFAULT_OUTBOX_DB}) "
+                             "and deliver them from background workers")
+    parser.add_argument('--outbox-workers', type=int, default=DEFAULT_OUTBOX_WORKERS,
+                        help="Number of outbox delivery threads")
+    parser.add_argument('--outbox-max-age', type=float, default=DEFAULT_OUTBOX_MAX_AGE,
+                        help="Seconds after which a queued tweet is dropped instead of posted")
+    parser.add_argument('--outbox-drain-timeout', type=float, default=300.0,
+                        help="Seconds a one-shot run waits for queued tweets to be delivered")
+    parser.add_argument('--tip-pool-file', default=DEFAULT_TIP_POOL_FILE,
+                        help="JSON file holding the daily pool of health tips")
+    parser.add_argument('--tip-pool-size', type=int, default=DEFAULT_TIP_POOL_SIZE,
+                        help="Number of tips generated per AQI category each day")
+    parser.add_argument('--per-category-tips', action='store_true',
+                        help="Fill the tip pool with one Gemini call per category instead of one for all")
+    parser.add_argument('--no-tip-pool', action='store_true',
+                        help="Ask Gemini for a fresh tip on every tweet")
+    args = parser.parse_args()
+    if args.dry_run and args.outbox:
+        # The outbox worker would "deliver" real queued tweets to the dry-run sink and mark them sent
+        parser.error("--dry-run can't be combined with --outbox")
+    return args
+
 if __name__ == "__main__":
+    args = parse_args()
+    configure_logging(args.log_level, args.log_format)
+    configure_http(HTTPConfig(
+        pool_size=args.pool_size,
+        keep_alive=not args.no_keep_alive,
+        connect_timeout=args.connect_timeout,
+        read_timeout=args.read_timeout
+    ))
+    configure_retry(RetryPolicy(attempts=args.fetch_attempts, deadline=args.fetch_deadline))
+    if args.cache_ttl > 0:
+        configure_cache(AQICache(ttl=args.cache_ttl, maxsize=args.cache_size, path=args.cache_file))
+    else:
+        configure_cache(None)
+    if args.forecast:
+        configure_forecast(ForecastCache(ttl=args.forecast_ttl, maxsize=args.cache_size))
+    if not args.no_readings_db:
+        configure_reading_store(ReadingStore(args.readings_db))
+    if args.dry_run:
+        configure_sink(JSONLSink(args.dry_run_file) if args.dry_run_file else StdoutSink())
+    if args.always_post or args.dry_run:
+        configure_post_state(None)
+    else:
+        configure_post_state(PostState(path=args.post_state_file, min_aqi_delta=args.min_aqi_delta,
+                                       repost_after_hours=args.repost_after_hours))
+    if args.no_tip_pool:
+        configure_tip_pool(None)
+    else:
+        configure_tip_pool(TipPool(path=args.tip_pool_file, size=args.tip_pool_size,
+                                   batch=not args.per_category_tips))
+    if args.outbox:
+        configure_outbox(Outbox(args.outbox, max_age=args.outbox_max_age))
+    if not args.daemon:
+        configure_run_report(RunReport())
     try:
         # Load locations from config file
-        locations = load_location_config('config.json')
+        with timed_stage(None, 'config'):
+            locations = load_location_config(args.config)
         
-        # Update AQI for each location
-        for location in locations:
-            print(f"\n--- Processing {location.name} ---")
-            print(f"Twitter API Key: {location.twitter_credentials['api_key'][:4]}...")  # Only print first 4 chars for security
-            bot = AQIBot(location)
-            bot.update_aqi()
+        if args.backfill:
+            if _reading_store is None:
+                raise ValueError("--backfill needs the readings database (drop --no-readings-db)")
+            start, end = (int(datetime.combine(day, datetime.min.time(), tzinfo=pytz.utc).timestamp())
+                          for day in args.backfill)
+            summary = backfill(locations, start, end, _reading_store, window_days=args.backfill_window_days,
+                               concurrency=args.concurrency)
+            print("\n--- Backfill summary ---")
+            for name, entry in summary.items():
+                print(f"{name}: {entry['done']} windows stored ({entry['rows']} rows), "
+                      f"{entry['skipped']} already done, {entry['failed']} failed")
+        elif args.daemon:
+            if args.metrics_port:
+                start_metrics_server(args.metrics_port)
+            daemon = AQIDaemon(locations, concurrency=args.concurrency, metrics_file=args.metrics_file,
+                               outbox_workers=args.outbox_workers)
+            daemon.run_forever(run_on_start=args.run_on_start)
+        else:
+            # Deliver queued tweets (including leftovers from earlier runs) while this run composes new ones
+            worker = None
+            if _outbox is not None:
+                bots = {location.name: AQIBot(location) for location in locations}
+                worker = OutboxWorker(_outbox, bots, workers=args.outbox_workers).start()
+            
+            # Update AQI for all locations, processing them concurrently
+            pipeline = None
+            if args.asyncio:
+                results = asyncio.run(run_locations_async(locations, concurrency=args.async_concurrency))
+            elif args.pipeline:
+                results, pipeline = run_locations_pipelined(locations, workers=args.stage_workers,
+                                                            queue_size=args.queue_size)
+            else:
+                results = run_locations(locations, concurrency=args.concurrency)
+            print_run_summary(results)
+            
+            if worker is not None:
+                if not worker.drain(args.outbox_drain_timeout):
+                    logger.warning("Outbox not drained within %.0fs", args.outbox_drain_timeout,
+                                   extra={'stage': 'outbox'})
+                worker.stop()
+                print(f"Outbox: {_outbox.counts()}")
+            print()
+            print(_run_report.format_table())
+            if pipeline is not None:
+                print()
+                print(pipeline.format_stats())
+            if args.report:
+                _run_report.write_json(args.report)
+            if args.metrics_file:
+                write_metrics_textfile(args.metrics_file)
     except Exception as e:
-        print(f"Error: {e}")
-        print(f"Full exception: {repr(e)}")
\ No newline at end of file
+        logger.exception("Error: %s", e)
+    finally:
+        _sink.close()
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import main
+
+DAY = 86400
+START = 1_700_000_000 - 1_700_000_000 % DAY
+
+
+class StubHistory:
+    """Hourly history for any window, except windows listed in ``failing`` (which return None)"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = []
+
+    def __call__(self, latitude, longitude, api_key, start, end, stats=None):
+        self.calls.append((start, end))
+        if (start, end) in self.failing:
+            return None
+        return main.Forecast.from_response({'list': [
+            {'dt': ts, 'main': {'aqi': 2}, 'components': {'pm2_5': 12.0, 'pm10': 20.0}}
+            for ts in range(start, end, 3600)
+        ]})
+
+
+class BackfillResumeTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = main.ReadingStore(os.path.join(self.tmp.name, 'readings.db'))
+        # Two locations in one grid cell share every request
+        self.locations = [
+            main.Location('Here', 12.971, 77.594, 'UTC', {}, 'key', 'key'),
+            main.Location('Nearby', 12.972, 77.593, 'UTC', {}, 'key', 'key'),
+        ]
+        self.windows = main.backfill_windows(START, START + 3 * DAY, window_days=1)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def run_backfill(self, history):
+        with mock.patch.object(main, 'fetch_air_pollution_history', history):
+            return main.backfill(self.locations, START, START + 3 * DAY, self.store, window_days=1, concurrency=2)
+
+    def test_rerun_only_fetches_failed_window(self):
+        failed = self.windows[1]
+        first = StubHistory(failing=[failed])
+        summary = self.run_backfill(first)
+        self.assertEqual(sorted(first.calls), self.windows)
+        self.assertEqual(summary['Here'], {'windows': 3, 'skipped': 0, 'done': 2, 'failed': 1, 'rows': 48})
+        self.assertEqual(self.store.completed_windows('Here'), set(self.windows) - {failed})
+
+        second = StubHistory()
+        summary = self.run_backfill(second)
+        self.assertEqual(second.calls, [failed])
+        self.assertEqual(summary['Nearby'], {'windows': 3, 'skipped': 2, 'done': 1, 'failed': 0, 'rows': 24})
+        self.assertEqual(len(self.store.query('Here')), 72)
+
+        third = StubHistory()
+        summary = self.run_backfill(third)
+        self.assertEqual(third.calls, [])
+        self.assertEqual(summary['Here']['skipped'], 3)
+
+    def test_append_window_is_idempotent(self):
+        history = StubHistory()(0, 0, 'key', START, START + DAY)
+        self.assertEqual(self.store.append_window('Here', START, START + DAY, history), 24)
+        self.assertEqual(self.store.append_window('Here', START, START + DAY, history), 0)
+        self.assertEqual(self.store.completed_windows('Here'), {(START, START + DAY)})
+        self.assertEqual(len(self.store.query('Here')), 24)
+
+
+if __name__ == '__main__':
+    unittest.main()
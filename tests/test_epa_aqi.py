@@ -0,0 +1,124 @@
+import math
+import unittest
+
+import numpy as np
+
+import main
+
+
+def ugm3(pollutant, value):
+    """Convert a concentration in the table's units (ppm/ppb) back to OpenWeatherMap μg/m³"""
+    conversion, _, _ = main.EPA_AQI_BREAKPOINTS[pollutant]
+    return value / conversion
+
+
+def sub_index(pollutant, concentration):
+    return float(main.compute_pollutant_aqi(pollutant, concentration))
+
+
+class ParticulateBreakpointTests(unittest.TestCase):
+    def test_pm2_5_band_edges(self):
+        self.assertEqual(sub_index('pm2_5', 0.0), 0)
+        self.assertEqual(sub_index('pm2_5', 9.0), 50)
+        self.assertEqual(sub_index('pm2_5', 9.1), 51)
+        self.assertEqual(sub_index('pm2_5', 35.4), 100)
+        self.assertEqual(sub_index('pm2_5', 35.5), 101)
+
+    def test_pm2_5_truncates_instead_of_rounding(self):
+        # 9.09 truncates to 9.0 (Good), not 9.1
+        self.assertEqual(sub_index('pm2_5', 9.09), 50)
+
+    def test_pm10_band_edges(self):
+        self.assertEqual(sub_index('pm10', 54), 50)
+        self.assertEqual(sub_index('pm10', 55), 51)
+        self.assertEqual(sub_index('pm10', 154), 100)
+        self.assertEqual(sub_index('pm10', 155), 101)
+
+    def test_clamps_at_top_of_table(self):
+        self.assertEqual(sub_index('pm2_5', 325.4), 500)
+        self.assertEqual(sub_index('pm2_5', 1000.0), 500)
+        self.assertEqual(sub_index('pm10', 5000), 500)
+        # Ozone's 8-hour table stops at 300
+        self.assertEqual(sub_index('o3', ugm3('o3', 1.0)), 300)
+
+    def test_negative_concentrations_clamp_to_zero(self):
+        self.assertEqual(sub_index('pm2_5', -1.0), 0)
+
+    def test_vectorized(self):
+        np.testing.assert_array_equal(
+            main.compute_pollutant_aqi('pm2_5', [9.0, 9.1, 35.4, 35.5]), [50, 51, 100, 101])
+
+
+class GasConversionTests(unittest.TestCase):
+    def test_o3_ppm(self):
+        self.assertEqual(sub_index('o3', ugm3('o3', 0.054)), 50)
+        self.assertEqual(sub_index('o3', ugm3('o3', 0.055)), 51)
+        # 100 μg/m³ of ozone is ~0.0509 ppm, which truncates to 0.050
+        self.assertEqual(sub_index('o3', 100.0), 46)
+
+    def test_no2_ppb(self):
+        self.assertEqual(sub_index('no2', ugm3('no2', 53)), 50)
+        self.assertEqual(sub_index('no2', ugm3('no2', 54)), 51)
+        # 100 μg/m³ of NO2 is ~53.1 ppb, which truncates to 53
+        self.assertEqual(sub_index('no2', 100.0), 50)
+
+    def test_so2_ppb(self):
+        self.assertEqual(sub_index('so2', ugm3('so2', 35)), 50)
+        self.assertEqual(sub_index('so2', ugm3('so2', 36)), 51)
+
+    def test_co_ppm(self):
+        self.assertEqual(sub_index('co', ugm3('co', 4.4)), 50)
+        self.assertEqual(sub_index('co', ugm3('co', 4.5)), 51)
+        # 1000 μg/m³ of CO is ~0.87 ppm, which truncates to 0.8
+        self.assertEqual(sub_index('co', 1000.0), 9)
+
+
+class OverallAQITests(unittest.TestCase):
+    def test_takes_max_sub_index(self):
+        aqi = main.compute_epa_aqi({'pm2_5': 9.1, 'pm10': 155, 'no': 500.0})
+        self.assertEqual(float(aqi), 101)
+
+    def test_missing_components_are_skipped(self):
+        self.assertEqual(float(main.compute_epa_aqi({'pm2_5': float('nan'), 'pm10': 55})), 51)
+        self.assertTrue(math.isnan(float(main.compute_epa_aqi({'pm2_5': float('nan')}))))
+
+    def test_requires_a_known_pollutant(self):
+        with self.assertRaises(ValueError):
+            main.compute_epa_aqi({'nh3': 1.0})
+
+    def test_epa_category(self):
+        self.assertEqual(main.get_epa_aqi_category({'pm2_5': 9.0})['category'], "Good")
+        self.assertEqual(main.get_epa_aqi_category({'pm2_5': 9.1})['category'], "Moderate")
+        self.assertEqual(main.get_epa_aqi_category({'pm2_5': 1000.0})['category'], "Hazardous")
+        self.assertIsNone(main.get_epa_aqi_category({'pm2_5': float('nan')}))
+
+
+class CategoryClampTests(unittest.TestCase):
+    def setUp(self):
+        self.bot = main.AQIBot(main.Location('Test', 0.0, 0.0, 'UTC', {}, 'key', 'key'))
+
+    def test_epa_aqi_stays_within_owm_category(self):
+        info = self.bot.get_aqi_category(1, 30.0, 20.0)
+        self.assertEqual(info['category'], "Good")
+        self.assertEqual(info['epa_aqi'], 50)
+
+        info = self.bot.get_aqi_category(5, 1000.0)
+        self.assertEqual(info['category'], "Very Poor")
+        self.assertEqual(info['epa_aqi'], 300)
+
+        info = self.bot.get_aqi_category(4, 1.0)
+        self.assertEqual(info['epa_aqi'], 151)
+
+    def test_missing_particulates(self):
+        self.assertIsNone(self.bot.get_aqi_category(2, float('nan'))['epa_aqi'])
+
+    def test_batch_matches_scalar(self):
+        readings = [main.Reading(index, pm2_5=pm25, pm10=pm10)
+                    for index, pm25, pm10 in [(1, 30.0, 20.0), (2, 9.5, 30.0), (3, 80.0, 10.0),
+                                              (5, 1000.0, 900.0), (4, float('nan'), float('nan'))]]
+        expected = [self.bot.get_aqi_category(r.aqi_index, r.pm2_5, r.pm10) for r in readings]
+        self.assertEqual(main.categorize_batch(readings), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
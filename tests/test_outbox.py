@@ -0,0 +1,177 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import main
+
+
+class StubBot:
+    """Stands in for AQIBot.send_tweet; each call pops the next outcome (True, False or an exception)"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.sent = []
+
+    def send_tweet(self, text):
+        outcome = self.outcomes.pop(0) if self.outcomes else True
+        if isinstance(outcome, Exception):
+            raise outcome
+        if outcome:
+            self.sent.append(text)
+        return outcome
+
+
+def full_backoff(low, high):
+    # Take the top of the jitter range so retry times are predictable
+    return high
+
+
+class OutboxTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'outbox.db')
+        self.outbox = main.Outbox(self.path)
+        self.state = main.PostState(path=None)
+        main.configure_post_state(self.state)
+
+    def tearDown(self):
+        main.configure_post_state(None)
+        self.outbox.close()
+        self.tmp.cleanup()
+
+    def worker(self, bot, **kwargs):
+        kwargs.setdefault('retry_policy', main.RetryPolicy(base_delay=60.0, max_delay=60.0))
+        return main.OutboxWorker(self.outbox, {'Here': bot}, **kwargs)
+
+    def set_column(self, item_id, column, value):
+        with self.outbox._conn:
+            self.outbox._conn.execute(f"UPDATE outbox SET {column} = ? WHERE id = ?", (value, item_id))
+
+
+class ClaimTests(OutboxTestCase):
+    def test_claims_oldest_ready_item_once(self):
+        first = self.outbox.enqueue('Here', "first")
+        self.outbox.enqueue('There', "second")
+
+        item = self.outbox.claim()
+        self.assertEqual((item['id'], item['text'], item['attempts']), (first, "first", 0))
+        self.assertEqual(self.outbox.claim()['text'], "second")
+        self.assertIsNone(self.outbox.claim())
+        self.assertEqual(self.outbox.counts(), {'sending': 2})
+
+    def test_round_trips_aqi_info(self):
+        info = {'category': "Good", 'emoji': "🟢", 'epa_aqi': 20}
+        self.outbox.enqueue('Here', "text", info)
+        self.assertEqual(self.outbox.claim()['aqi_info'], info)
+
+    def test_crash_resets_items_being_sent(self):
+        self.outbox.enqueue('Here', "text")
+        self.assertIsNotNone(self.outbox.claim())
+        self.outbox.close()
+
+        self.outbox = main.Outbox(self.path)
+        self.assertEqual(self.outbox.counts(), {'pending': 1})
+        self.assertEqual(self.outbox.claim()['text'], "text")
+
+    def test_expires_old_items(self):
+        old = self.outbox.enqueue('Here', "at 08:00 AM")
+        self.outbox.enqueue('There', "fresh")
+        self.set_column(old, 'created_at', time.time() - main.DEFAULT_OUTBOX_MAX_AGE - 1)
+
+        self.assertEqual(self.outbox.claim()['text'], "fresh")
+        self.assertEqual(self.outbox.counts(), {'expired': 1, 'sending': 1})
+
+    def test_new_tweet_supersedes_undelivered_one(self):
+        self.outbox.enqueue('Here', "older")
+        self.outbox.enqueue('Here', "newer")
+        self.assertEqual(self.outbox.claim()['text'], "newer")
+        self.assertIsNone(self.outbox.claim())
+        self.assertEqual(self.outbox.counts(), {'sending': 1, 'superseded': 1})
+
+
+class DeliveryTests(OutboxTestCase):
+    def test_records_post_state_only_when_sent(self):
+        info = {'category': "Good", 'emoji': "🟢", 'epa_aqi': 20}
+        self.outbox.enqueue('Here', "text", info)
+        self.assertNotIn('Here', self.state._state)
+
+        bot = StubBot(True)
+        self.assertTrue(self.worker(bot).deliver_one())
+        self.assertEqual(bot.sent, ["text"])
+        self.assertEqual(self.outbox.counts(), {'sent': 1})
+        self.assertEqual(self.state._state['Here']['epa_aqi'], 20)
+
+    @mock.patch.object(main.random, 'uniform', full_backoff)
+    def test_failed_delivery_is_retried_later(self):
+        item_id = self.outbox.enqueue('Here', "text", {'category': "Good", 'emoji': "🟢", 'epa_aqi': 20})
+        worker = self.worker(StubBot(False, True))
+
+        before = time.time()
+        self.assertTrue(worker.deliver_one())
+        self.assertEqual(self.outbox.counts(), {'pending': 1})
+        self.assertNotIn('Here', self.state._state)
+        # Not due again until the backoff has passed
+        self.assertIsNone(self.outbox.claim())
+        self.assertEqual(self.outbox.outstanding_count(before + 59), 0)
+        self.assertEqual(self.outbox.outstanding_count(), 1)
+
+        self.set_column(item_id, 'next_attempt_at', time.time())
+        self.assertTrue(worker.deliver_one())
+        self.assertEqual(self.outbox.counts(), {'sent': 1})
+        self.assertIn('Here', self.state._state)
+
+    def test_raising_sink_is_retried(self):
+        self.outbox.enqueue('Here', "text")
+        self.assertTrue(self.worker(StubBot(BrokenPipeError())).deliver_one())
+        self.assertEqual(self.outbox.counts(), {'pending': 1})
+        last_error = self.outbox._conn.execute("SELECT last_error FROM outbox").fetchone()[0]
+        self.assertIn('BrokenPipeError', last_error)
+
+    def test_gives_up_after_max_attempts(self):
+        item_id = self.outbox.enqueue('Here', "text")
+        worker = self.worker(StubBot(False, False), max_attempts=2)
+
+        worker.deliver_one()
+        self.set_column(item_id, 'next_attempt_at', time.time())
+        worker.deliver_one()
+        self.assertEqual(self.outbox.counts(), {'failed': 1})
+        self.assertIsNone(self.outbox.claim())
+        self.assertEqual(self.outbox.outstanding_count(), 0)
+
+    def test_unknown_location_fails(self):
+        self.outbox.enqueue('Elsewhere', "text")
+        self.assertTrue(self.worker(StubBot()).deliver_one())
+        self.assertEqual(self.outbox.counts(), {'failed': 1})
+
+    def test_nothing_to_deliver(self):
+        self.assertFalse(self.worker(StubBot()).deliver_one())
+
+    def test_drain_waits_for_retries_due_within_timeout(self):
+        self.outbox.enqueue('Here', "text")
+        bot = StubBot(False, True)
+        worker = self.worker(bot, retry_policy=main.RetryPolicy(base_delay=0.2, max_delay=0.2),
+                             poll_interval=0.05).start()
+        try:
+            self.assertTrue(worker.drain(5.0))
+        finally:
+            worker.stop()
+        self.assertEqual(bot.sent, ["text"])
+        self.assertEqual(self.outbox.counts(), {'sent': 1})
+
+    @mock.patch.object(main.random, 'uniform', full_backoff)
+    def test_drain_leaves_later_retries_queued(self):
+        self.outbox.enqueue('Here', "text")
+        worker = self.worker(StubBot(False), poll_interval=0.05).start()
+        try:
+            started = time.monotonic()
+            self.assertFalse(worker.drain(0.5))
+            self.assertLess(time.monotonic() - started, 5.0)
+        finally:
+            worker.stop()
+        self.assertEqual(self.outbox.counts(), {'pending': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
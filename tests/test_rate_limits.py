@@ -0,0 +1,107 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import main
+
+
+class TokenBucketTests(unittest.TestCase):
+    def test_burst_then_timeout(self):
+        bucket = main.TokenBucket(main.RateLimit(rate=1, per=60, burst=2))
+        self.assertTrue(bucket.acquire(timeout=0))
+        self.assertTrue(bucket.acquire(timeout=0))
+        # The next token is a minute away
+        started = time.monotonic()
+        self.assertFalse(bucket.acquire(timeout=0.5))
+        self.assertLess(time.monotonic() - started, 0.25)
+
+    def test_refills_over_time(self):
+        bucket = main.TokenBucket(main.RateLimit(rate=10, per=1, burst=1))
+        self.assertTrue(bucket.acquire(timeout=0))
+        self.assertFalse(bucket.acquire(timeout=0))
+        started = time.monotonic()
+        self.assertTrue(bucket.acquire(timeout=1.0))
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+
+    def test_refill_is_capped_at_burst(self):
+        with mock.patch.object(main.time, 'monotonic', return_value=1000.0) as now:
+            bucket = main.TokenBucket(main.RateLimit(rate=1, per=1, burst=2))
+            # A long idle period still only banks ``burst`` tokens
+            now.return_value = 2000.0
+            self.assertTrue(bucket.acquire(timeout=0))
+            self.assertTrue(bucket.acquire(timeout=0))
+            self.assertFalse(bucket.acquire(timeout=0))
+
+
+class RegistryTests(unittest.TestCase):
+    def setUp(self):
+        self.registry = main.RateLimiterRegistry({'gemini': main.RateLimit(rate=1, per=60, burst=1)})
+
+    def test_buckets_are_per_credential(self):
+        self.assertIs(self.registry.bucket('gemini', 'a'), self.registry.bucket('gemini', 'a'))
+        self.assertIsNot(self.registry.bucket('gemini', 'a'), self.registry.bucket('gemini', 'b'))
+
+    def test_unknown_provider_is_unlimited(self):
+        self.assertIsNone(self.registry.bucket('other', 'a'))
+        self.registry.acquire('other', 'a', timeout=0)
+
+    def test_acquire_raises_when_no_token_in_time(self):
+        self.registry.acquire('gemini', 'a', timeout=0)
+        with self.assertRaises(main.RateLimitTimeout):
+            self.registry.acquire('gemini', 'a', timeout=0)
+
+    def test_configure_provider_rebuilds_buckets(self):
+        old = self.registry.bucket('gemini', 'a')
+        self.registry.configure('gemini', main.RateLimit(rate=5, per=1, burst=3))
+        new = self.registry.bucket('gemini', 'a')
+        self.assertIsNot(new, old)
+        self.assertEqual(new.limit.burst, 3)
+
+    def test_configure_credential_override_survives_provider_change(self):
+        override = main.RateLimit(rate=2, per=1, burst=4)
+        self.registry.configure('gemini', override, credential='a')
+        self.registry.configure('gemini', main.RateLimit(rate=5, per=1, burst=3))
+        self.assertEqual(self.registry.bucket('gemini', 'a').limit, override)
+        self.assertEqual(self.registry.bucket('gemini', 'b').limit.burst, 3)
+
+
+class LocationRateLimitTests(unittest.TestCase):
+    def load(self, config):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'config.json')
+            with open(path, 'w') as f:
+                json.dump(config, f)
+            env = {'OPENWEATHER_API_KEY': 'owm-key', 'GEMINI_API_KEY': 'gemini-key'}
+            with mock.patch.dict(os.environ, env), mock.patch.object(main, 'load_dotenv'):
+                return main.load_location_config(path)
+
+    def location(self, name, rate_limits):
+        return {
+            'name': name, 'latitude': 1.0, 'longitude': 2.0, 'timezone': 'UTC',
+            'twitter_credentials': {'api_key': 'k', 'api_secret': 's',
+                                    'access_token': f'{name}-token', 'access_token_secret': 't'},
+            'rate_limits': rate_limits,
+        }
+
+    @mock.patch.object(main, 'rate_limiters', main.RateLimiterRegistry())
+    def test_only_twitter_limits_apply_per_location(self):
+        self.load({
+            'rate_limits': {'openweathermap': {'rate': 30}},
+            'locations': [
+                self.location('first', {'twitter': {'rate': 1, 'burst': 1}}),
+                self.location('second', {'openweathermap': {'rate': 1}, 'gemini': {'rate': 1}}),
+            ],
+        })
+        registry = main.rate_limiters
+        self.assertEqual(registry.bucket('twitter', 'first-token').limit, main.RateLimit(rate=1, burst=1))
+        self.assertEqual(registry.bucket('twitter', 'second-token').limit, main.DEFAULT_RATE_LIMITS['twitter'])
+        # The shared keys keep the top-level and default limits
+        self.assertEqual(registry.bucket('openweathermap', 'owm-key').limit, main.RateLimit(rate=30))
+        self.assertEqual(registry.bucket('gemini', 'gemini-key').limit, main.DEFAULT_RATE_LIMITS['gemini'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from unittest import mock
+
+import requests
+
+import main
+
+
+class StubResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class StubSession:
+    """Returns (or raises) the queued outcomes in order and records each call"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class GetWithRetryTests(unittest.TestCase):
+    def setUp(self):
+        self.sleeps = []
+        patches = [
+            mock.patch.object(main.time, 'sleep', self.sleeps.append),
+            mock.patch.object(main.rate_limiters, 'acquire'),
+            # Deterministic backoff: always the top of the jitter range
+            mock.patch.object(main.random, 'uniform', lambda low, high: high),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def get(self, session, policy=None):
+        self.stats = {}
+        with mock.patch.object(main, 'get_http_session', return_value=session):
+            return main.get_with_retry('http://example.invalid', {'appid': 'key'}, self.stats, {},
+                                       policy=policy or main.RetryPolicy(attempts=3, base_delay=1.0))
+
+    def test_returns_first_non_retryable_response(self):
+        session = StubSession(StubResponse(404))
+        self.assertEqual(self.get(session).status_code, 404)
+        self.assertEqual((session.calls, self.sleeps, self.stats), (1, [], {}))
+
+    def test_retries_server_errors_with_backoff(self):
+        session = StubSession(StubResponse(503), StubResponse(502), StubResponse(200))
+        self.assertEqual(self.get(session).status_code, 200)
+        self.assertEqual(session.calls, 3)
+        self.assertEqual(self.sleeps, [1.0, 2.0])
+        self.assertEqual(self.stats['retries'], 2)
+
+    def test_returns_last_error_response_when_attempts_run_out(self):
+        session = StubSession(StubResponse(500), StubResponse(500), StubResponse(503))
+        self.assertEqual(self.get(session).status_code, 503)
+        self.assertEqual(len(self.sleeps), 2)
+
+    def test_honours_retry_after_seconds(self):
+        session = StubSession(StubResponse(429, {'Retry-After': '7'}), StubResponse(200))
+        self.assertEqual(self.get(session).status_code, 200)
+        self.assertEqual(self.sleeps, [7.0])
+
+    def test_honours_retry_after_http_date(self):
+        when = datetime.now(timezone.utc) + timedelta(seconds=30)
+        session = StubSession(StubResponse(429, {'Retry-After': format_datetime(when, usegmt=True)}),
+                              StubResponse(200))
+        self.assertEqual(self.get(session).status_code, 200)
+        self.assertEqual(len(self.sleeps), 1)
+        self.assertAlmostEqual(self.sleeps[0], 30, delta=2)
+
+    def test_stops_when_retry_would_pass_deadline(self):
+        session = StubSession(StubResponse(429, {'Retry-After': '120'}), StubResponse(200))
+        response = self.get(session, main.RetryPolicy(attempts=3, deadline=60.0))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual((session.calls, self.sleeps), (1, []))
+
+    def test_retries_connection_errors(self):
+        session = StubSession(requests.ConnectionError("refused"), StubResponse(200))
+        self.assertEqual(self.get(session).status_code, 200)
+        self.assertEqual(self.stats['retries'], 1)
+
+    def test_reraises_last_connection_error(self):
+        session = StubSession(requests.ConnectionError("first"), requests.Timeout("second"),
+                              requests.ConnectionError("last"))
+        with self.assertRaisesRegex(requests.ConnectionError, "last"):
+            self.get(session)
+        self.assertEqual(session.calls, 3)
+
+
+class RetryDelayTests(unittest.TestCase):
+    def setUp(self):
+        self.policy = main.RetryPolicy(attempts=3, base_delay=1.0, max_delay=4.0, deadline=60.0)
+
+    def delay(self, attempt, retry_after=None, deadline_in=60.0):
+        return main.retry_delay(self.policy, attempt, time.monotonic() + deadline_in, 503, retry_after,
+                                None, {}, {})
+
+    def test_gives_up_after_last_attempt(self):
+        self.assertIsNone(self.delay(3))
+
+    def test_backoff_is_capped(self):
+        with mock.patch.object(main.random, 'uniform', lambda low, high: high):
+            self.assertEqual(self.delay(1), 1.0)
+            self.assertEqual(self.delay(2), 2.0)
+            self.policy.attempts = 10
+            self.assertEqual(self.delay(5), 4.0)
+
+    def test_retry_after_overrides_backoff(self):
+        self.assertEqual(self.delay(1, retry_after='3'), 3.0)
+
+    def test_deadline_cut_off(self):
+        self.assertIsNone(self.delay(1, retry_after='10', deadline_in=5.0))
+
+    def test_counts_retries(self):
+        stats = {}
+        main.retry_delay(self.policy, 1, time.monotonic() + 60, None, None,
+                         requests.ConnectionError("refused"), stats, {})
+        self.assertEqual(stats, {'retries': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
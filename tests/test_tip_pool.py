@@ -0,0 +1,105 @@
+import threading
+import time
+import unittest
+
+import main
+
+
+class Generator:
+    """Counts calls to a per-category tip generator and returns ``tips`` after ``delay`` seconds"""
+
+    def __init__(self, tips=None, delay=0.0):
+        self.tips = tips if tips is not None else []
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, category, count):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return list(self.tips)
+
+
+class TipPoolTests(unittest.TestCase):
+    def test_serves_tips_in_rotation_after_one_fill(self):
+        pool = main.TipPool(path=None, batch=False)
+        generate = Generator(["a", "b"])
+        self.assertEqual([pool.get_tip("Good", generate) for _ in range(3)], ["a", "b", "a"])
+        self.assertEqual(generate.calls, 1)
+
+    def test_failed_fill_is_not_retried_during_cooldown(self):
+        pool = main.TipPool(path=None, batch=False, retry_after=60.0)
+        generate = Generator([])
+        for _ in range(5):
+            self.assertIsNone(pool.get_tip("Good", generate))
+        self.assertEqual(generate.calls, 1)
+
+    def test_failed_fill_is_retried_after_cooldown(self):
+        pool = main.TipPool(path=None, batch=False, retry_after=0.0)
+        self.assertIsNone(pool.get_tip("Good", Generator([])))
+        self.assertEqual(pool.get_tip("Good", Generator(["a"])), "a")
+
+    def test_concurrent_misses_share_one_fill(self):
+        pool = main.TipPool(path=None, batch=False)
+        generate = Generator(["a"], delay=0.2)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(pool.get_tip("Good", generate)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(generate.calls, 1)
+        self.assertEqual(results, ["a"] * 8)
+
+    def test_fill_does_not_block_other_categories(self):
+        pool = main.TipPool(path=None, batch=False)
+        pool.get_tip("Fair", Generator(["fair"]))
+        slow = threading.Thread(target=pool.get_tip, args=("Good", Generator(["good"], delay=0.5)))
+        slow.start()
+        try:
+            time.sleep(0.05)
+            started = time.monotonic()
+            self.assertEqual(pool.get_tip("Fair", Generator()), "fair")
+            self.assertLess(time.monotonic() - started, 0.25)
+        finally:
+            slow.join()
+
+    def test_batch_fill_covers_every_category(self):
+        pool = main.TipPool(path=None)
+        calls = []
+
+        def generate_all(count):
+            calls.append(count)
+            return {category: [f"{category} tip"] for category in main.AQI_CATEGORIES}
+
+        per_category = Generator(["unused"])
+        self.assertEqual(pool.get_tip("Good", per_category, generate_all), "Good tip")
+        self.assertEqual(pool.get_tip("Poor", per_category, generate_all), "Poor tip")
+        self.assertEqual(calls, [main.DEFAULT_TIP_POOL_SIZE])
+        self.assertEqual(per_category.calls, 0)
+
+    def test_failed_batch_fill_skips_per_category_fill(self):
+        pool = main.TipPool(path=None, retry_after=60.0)
+        calls = []
+
+        def generate_all(count):
+            calls.append(count)
+            return {}
+
+        per_category = Generator(["unused"])
+        for _ in range(10):
+            self.assertIsNone(pool.get_tip("Good", per_category, generate_all))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(per_category.calls, 0)
+
+    def test_partial_batch_fill_falls_back_per_category(self):
+        pool = main.TipPool(path=None)
+        per_category = Generator(["poor tip"])
+        self.assertEqual(pool.get_tip("Poor", per_category, lambda count: {"Good": ["good tip"]}), "poor tip")
+        self.assertEqual(per_category.calls, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()